@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Solves many rosters at once, e.g. every department for a quarter.
+
+A batch is a JSON list of items, each a request body as accepted by
+service.parse_body plus its horizon and an id:
+
+    [{"id": "cardiology-2024-0", "days": 31, "docs": [...]}, ...]
+
+Items are solved concurrently and one JSON line is written per item as
+soon as it finishes, in completion order:
+
+    python3 batch.py quarter.json --workers 4
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+
+import service
+
+
+def solve_item(item, num_workers=None):
+    """Solves one batch item, returning its result line as a dict.
+
+    `num_workers` is the number of CP-SAT workers, one per core by
+    default. Errors are reported in the result rather than raised, so one
+    bad item does not fail the rest of the batch.
+    """
+    item_id = item_id_of(item)
+    try:
+        doc_list, num_days, options = parse_item(item)
+        schedule = service.solve_payload(doc_list, num_days, options, num_workers=num_workers)
+    except (KeyError, ValueError, TypeError) as e:
+        return {"id": item_id, "error": "bad request: %s" % e}
+    except Exception as e:
+        return {"id": item_id, "error": "solve failed: %s" % e}
+    return {"id": item_id, "status": schedule.status, "schedule": schedule, "stats": schedule.stats}
+
+
+def item_id_of(item):
+    return item.get("id") if isinstance(item, dict) else None
+
+
+def parse_item(item):
+    """Returns the (doc_list, num_days, options) of a batch item."""
+    if not isinstance(item, dict):
+        raise ValueError("each batch item must be an object")
+    options = dict(item)
+    options.pop("id", None)
+    doc_list = options.pop("docs")
+    num_days = int(options.pop("days"))
+    return doc_list, num_days, options
+
+
+def event_result(item_id, event):
+    """Returns the result line of an item from its job's final event."""
+    if "error" in event:
+        return {"id": item_id, "error": event["error"]}
+    return {"id": item_id, "status": event["status"], "schedule": event["schedule"],
+            "stats": event["stats"]}
+
+
+def solve_batch(items, executor=None, workers=None, num_workers=None):
+    """Yields the result of each item as it completes.
+
+    Args:
+      items: a list of batch items, see the module docstring.
+      executor: a concurrent.futures executor to run the solves on; by
+        default a process pool of `workers` processes is used.
+      workers: the size of the default process pool, one per core by
+        default.
+      num_workers: the CP-SAT workers of each solve. With the default
+        process pool, the cores are split between its processes by
+        default; otherwise each solve uses every core.
+    """
+    own_executor = executor is None
+    if own_executor:
+        cores = os.cpu_count() or 1
+        workers = workers or cores
+        if num_workers is None:
+            # Split the cores between the concurrent solves.
+            num_workers = max(1, cores // workers)
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(solve_item, item, num_workers): item for item in items}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # The worker process itself died; solve_item catches the rest.
+                item = futures[future]
+                item_id = item.get("id") if isinstance(item, dict) else None
+                yield {"id": item_id, "error": "solve failed: %s" % e}
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("batch", help="a JSON list of batch items")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of concurrent solves (default: one per core)")
+    args = parser.parse_args()
+    with open(args.batch) as f:
+        items = json.load(f)
+    failed = 0
+    for result in solve_batch(items, workers=args.workers):
+        failed += "error" in result
+        print(json.dumps(result), flush=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Benchmarks input parsing, model construction and solving.
+
+Synthetic rosters are generated at several scales and each phase is timed
+separately. The JSON report can be compared with one from another commit:
+
+    python3 bench.py --output before.json
+    python3 bench.py --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from ortools import __version__ as ortools_version
+from ortools.sat.python import cp_model
+
+import solve
+from rules import Rules, SequenceRule
+
+# The default sequence rule used to compare encodings: 2-3 consecutive
+# nights, with 1 and 4 possible but penalized.
+SEQUENCE_RULE = (solve.NIGHT, 1, 2, 20, 3, 4, 5)
+
+# name -> (docs, days)
+SCALES = {
+    "small": (6, 31),
+    "medium": (20, 31),
+    "large": (60, 90),
+    "xlarge": (200, 90),
+}
+
+
+def generate_roster(
+    num_docs,
+    num_days,
+    preference_density=0.1,
+    unavailable_density=0.1,
+    double_share=0.2,
+    seed=0,
+):
+    """Returns a random doc list in the format posted by dynamic.js.
+
+    Args:
+      num_docs: the number of doctors.
+      num_days: the horizon the days are drawn from.
+      preference_density: the share of days each doc prefers.
+      unavailable_density: the share of days each doc is unavailable.
+      double_share: the share of docs who prefer double shifts.
+      seed: the random seed, so that rosters are reproducible.
+    """
+    rng = random.Random(seed)
+    # Spread the two shifts a day across the docs, with some slack.
+    average = 2 * num_days / num_docs
+    docs = []
+    for i in range(num_docs):
+        days = list(range(num_days))
+        rng.shuffle(days)
+        num_preferred = int(preference_density * num_days)
+        num_unavailable = int(unavailable_density * num_days)
+        low = max(0, int(average * rng.uniform(0.5, 1.0)))
+        docs.append({
+            "name": "doc%i" % i,
+            "preferred": sorted(days[:num_preferred]),
+            "unavailable": sorted(days[num_preferred:num_preferred + num_unavailable]),
+            "min": low,
+            "max": max(low, int(average * rng.uniform(1.0, 1.5)) + 1),
+            "prefer_double": rng.random() < double_share,
+        })
+    return docs
+
+
+def run_case(name, docs, num_days, policy, num_workers, rules=None, break_symmetry=False):
+    """Times the phases of one solve and returns the report entry."""
+    if isinstance(policy, str):
+        policy = solve.POLICIES[policy]
+    contents = json.dumps(docs)
+    build_args = (solve.MAX_UNFILLED, num_days)
+    build_options = {"rules": rules, "break_symmetry": break_symmetry}
+
+    # Tracing allocations slows Python down, so memory is measured on a
+    # separate parse and build from the timed one.
+    tracemalloc.start()
+    solve.build_model(*solve.process_inputs(contents), *build_args, **build_options)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    inputs = solve.process_inputs(contents)
+    parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shift_model = solve.build_model(*inputs, *build_args, **build_options)
+    build_time = time.perf_counter() - start
+
+    model = shift_model.model
+    solver = solve.make_solver(model, policy, num_workers)
+    # Searched as solve.solve_model does, so that stall policies apply.
+    solution_printer = solve.SolutionPrinter(policy)
+    start = time.perf_counter()
+    status = solve.run_search(solver, model, solution_printer)
+    solve_time = time.perf_counter() - start
+
+    found = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    return {
+        "name": name,
+        "docs": len(docs),
+        "days": num_days,
+        "variables": len(model.Proto().variables),
+        "constraints": len(model.Proto().constraints),
+        "symmetry_classes": len(shift_model.symmetry_classes),
+        # Size of the text-format model, a proxy for its memory footprint.
+        "model_size": len(str(model.Proto())),
+        "parse_time": parse_time,
+        "build_time": build_time,
+        "solve_time": solve_time,
+        "first_solution_time": solution_printer.first_solution_time(),
+        "best_solution_time": solution_printer.best_solution_time(),
+        "status": solver.StatusName(status),
+        "objective": solver.ObjectiveValue() if found else None,
+        "bound": solver.BestObjectiveBound() if found else None,
+        "python_peak_memory": python_peak,
+        # ru_maxrss also covers the solver, but never goes down between cases.
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_commit():
+    """Returns the current commit hash, or None outside a git checkout."""
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def compare(report, baseline):
+    """Writes the relative change of each timing against `baseline`."""
+    previous = {case["name"]: case for case in baseline["cases"]}
+    for case in report["cases"]:
+        old = previous.get(case["name"])
+        if old is None:
+            continue
+        line = "%-18s" % case["name"]
+        for key in ("parse_time", "build_time", "solve_time", "first_solution_time",
+                    "best_solution_time", "model_size", "objective"):
+            # Reports from before a key was added lack it.
+            if not old.get(key) or case[key] is None:
+                continue
+            line += "  %s %+0.1f%%" % (key, 100.0 * (case[key] - old[key]) / abs(old[key]))
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="small,medium,large",
+                        help="comma separated names from: %s" % ", ".join(SCALES))
+    parser.add_argument("--preference-density", type=float, default=0.1)
+    parser.add_argument("--unavailable-density", type=float, default=0.1)
+    parser.add_argument("--double-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--policy", default="fixed", choices=sorted(solve.POLICIES))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="CP-SAT search workers (default: all cores)")
+    parser.add_argument("--sequence-encoding", choices=["clauses", "counter", "both"],
+                        help="add a night-shift sequence rule with this encoding; "
+                             "'both' runs every scale with each encoding")
+    parser.add_argument("--sequence-rule", default=",".join(map(str, SEQUENCE_RULE)),
+                        help="shift,hard_min,soft_min,min_penalty,soft_max,hard_max,max_penalty")
+    parser.add_argument("--break-symmetry", action="store_true",
+                        help="order interchangeable docs in the model")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="a previous JSON report to compare with")
+    args = parser.parse_args()
+
+    if args.sequence_encoding == "both":
+        encodings = ["clauses", "counter"]
+    else:
+        encodings = [args.sequence_encoding]
+
+    cases = []
+    for scale in args.scales.split(","):
+        num_docs, num_days = SCALES[scale]
+        docs = generate_roster(
+            num_docs, num_days, args.preference_density, args.unavailable_density,
+            args.double_share, args.seed,
+        )
+        for encoding in encodings:
+            name = scale
+            rules = None
+            if encoding is not None:
+                name = "%s+%s" % (scale, encoding)
+                rule = SequenceRule(*(int(x) for x in args.sequence_rule.split(",")), encoding)
+                rules = Rules(shift_constraints=(rule,)).validate()
+            case = run_case(name, docs, num_days, args.policy, args.workers, rules,
+                            args.break_symmetry)
+            sys.stderr.write(
+                "%-18s parse %0.3f s, build %0.3f s, solve %0.2f s (best at %s s), "
+                "%i vars, %i constraints, %s\n"
+                % (name, case["parse_time"], case["build_time"], case["solve_time"],
+                   "%0.2f" % case["best_solution_time"]
+                   if case["best_solution_time"] is not None else "-",
+                   case["variables"], case["constraints"], case["status"])
+            )
+            cases.append(case)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "ortools": ortools_version,
+        "policy": args.policy,
+        "seed": args.seed,
+        "cases": cases,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Content-addressed cache of solved schedules.
+
+Identical requests (same docs, bounds, preferences, unavailability,
+prefer_double flags, horizon and MAX_UNFILLED) hash to the same key, so a
+repeated "Generate" click returns the stored schedule without solving.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+import solve
+from rules import DEFAULT_RULES
+
+# Statuses whose schedules are worth keeping; a timed-out UNKNOWN is not.
+CACHEABLE_STATUSES = ("OPTIMAL", "FEASIBLE", "INFEASIBLE")
+
+
+def cache_key(
+    docs, desired, preferences, unavailable, prefer_double, max_unfilled, num_days,
+    policy=solve.DEFAULT_POLICY, rules=DEFAULT_RULES,
+):
+    """Returns a stable hash of the normalized solve inputs.
+
+    Doc order is significant since schedules refer to docs by index; the
+    per-doc day lists are not. The stop policy name is part of the key so a
+    quick answer is not served to a request asking for a thorough one, and
+    the rules are part of it since they change the model.
+    """
+    normalized = {
+        "docs": [
+            [
+                doc,
+                list(desired[doc]),
+                sorted(set(preferences.get(doc, ()))),
+                sorted(set(unavailable.get(doc, ()))),
+                bool(prefer_double.get(doc, False)),
+            ]
+            for doc in docs
+        ],
+        "max_unfilled": max_unfilled,
+        "num_days": num_days,
+        "policy": policy,
+        "rules": rules,
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def write_json(path, data):
+    """Writes `data` as JSON to `path`, atomically.
+
+    The data is written to a temporary file then renamed, so concurrent
+    readers never see a partial file.
+    """
+    tmp = "%s.%i.tmp" % (path, threading.get_ident())
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class LruStore:
+    """Thread-safe LRU map, optionally backed by a directory of JSON files.
+
+    Values are kept in memory as they are; on disk, each key is a
+    `<key>.json` file holding the JSON form of its value.
+    """
+
+    def __init__(self, capacity, directory=None):
+        self.capacity = capacity
+        self.directory = directory
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def __remember(self, key, value):
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.capacity:
+            self.__entries.popitem(last=False)
+
+    def get(self, key, decode=None):
+        """Returns the value of `key`, or None.
+
+        On a memory miss the value is read from the directory, converted
+        from its JSON form by `decode` if given, and kept in memory. A file
+        that cannot be read or decoded is a miss.
+        """
+        with self.__lock:
+            value = self.__entries.get(key)
+            if value is not None:
+                self.__entries.move_to_end(key)
+                return value
+        if not self.directory:
+            return None
+        try:
+            with open(self.__path(key)) as f:
+                value = json.load(f)
+            if decode is not None:
+                value = decode(value)
+        except (OSError, ValueError, KeyError):
+            return None
+        with self.__lock:
+            self.__remember(key, value)
+        return value
+
+    def put(self, key, value, encoded=None):
+        """Stores `value` under `key`.
+
+        Args:
+          encoded: the JSON form of `value` written to the directory; the
+            value itself by default.
+        """
+        with self.__lock:
+            self.__remember(key, value)
+        if self.directory:
+            write_json(self.__path(key), value if encoded is None else encoded)
+
+
+class ScheduleCache:
+    """LRU cache of schedules, optionally backed by a directory on disk.
+
+    Entries are stored as `{"schedule": [...], "status": "OPTIMAL", "stats":
+    {...}}` so a hit tells whether the schedule was proven optimal or only
+    feasible, and how the original solve went.
+    """
+
+    def __init__(self, capacity=128, directory=None):
+        self.__store = LruStore(capacity, directory)
+
+    def get(self, key):
+        """Returns the cached solve.Schedule for `key`, or None."""
+        entry = self.__store.get(key)
+        if entry is None:
+            return None
+        return solve.Schedule(entry["schedule"], entry["status"], dict(entry.get("stats", {})))
+
+    def put(self, key, schedule):
+        """Stores `schedule` under `key` if its status is worth caching."""
+        if schedule.status not in CACHEABLE_STATUSES:
+            return
+        entry = {"schedule": list(schedule), "status": schedule.status, "stats": dict(schedule.stats)}
+        self.__store.put(key, entry)
@@ -1,20 +1,37 @@
 #!/usr/bin/env python3
-import cgi
 import sys
 import os
 import json
-import urllib
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
-import solve
-
-print("Content-Type: application/json")
-print()
+import service
 
 body = sys.stdin.read(int(os.environ["CONTENT_LENGTH"]))
 query = os.environ["QUERY_STRING"]
-pairs = urllib.parse.parse_qs(query)
-inputs = solve.process_inputs(body)
-docs, desired, preferred, unavailable, prefer_double = inputs
-num_days = int(pairs["days"][0])
-result = solve.solve_shift_scheduling(docs, desired, preferred, unavailable, prefer_double, solve.MAX_UNFILLED, num_days)
-print(json.dumps(result))
+
+if service.wants_stream(query):
+    # One JSON object per line, flushed as each better schedule is found.
+    print("Content-Type: application/x-ndjson")
+    print(flush=True)
+
+    def listener(objective, schedule):
+        print(json.dumps(service.progress_event(objective, schedule)), flush=True)
+
+    try:
+        result = service.solve_request(body, query, listener)
+    except (KeyError, ValueError, TypeError) as e:
+        # The headers are out; the error ends the stream like a final event.
+        print(json.dumps({"error": "bad request: %s" % e, "done": True}))
+    else:
+        print(json.dumps(service.final_event(result)))
+else:
+    try:
+        result = service.solve_request(body, query)
+    except (KeyError, ValueError, TypeError) as e:
+        print("Status: 400 Bad Request")
+        print("Content-Type: application/json")
+        print()
+        print(json.dumps({"error": "bad request: %s" % e}))
+    else:
+        print("Content-Type: application/json")
+        print()
+        print(json.dumps(result))
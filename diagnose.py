@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Explains why a schedule request cannot be met.
+
+precheck() bounds what the docs can cover by counting alone, so requests
+that are impossible on their face are rejected in milliseconds instead of
+after a full solve. When it passes but CP-SAT still reports INFEASIBLE,
+unsat_core() re-solves the hard constraints alone under one assumption
+literal per group (a doc's bounds, a doc's rules, a day's cover demand,
+MAX_UNFILLED) and names the groups in the infeasible subset CP-SAT
+returns.
+
+    python3 diagnose.py inputs.json 31
+"""
+
+import json
+import sys
+from typing import NamedTuple
+
+from ortools.sat.python import cp_model
+
+import solve
+from rules import OFF, MORNING, NIGHT, NUM_SHIFTS, DEFAULT_RULES, compile_rules
+
+SHIFT_NAMES = {MORNING: "morning", NIGHT: "night"}
+
+# Time allowed to find an infeasible subset of the hard constraints.
+CORE_TIME = 5.0
+
+
+class Conflict(NamedTuple):
+    """One reason a request cannot be met.
+
+    Attributes:
+      kind: "bounds", "capacity", "cover", "rules" or "unfilled" for
+        conflicts, "unavailable" for warnings.
+      message: a sentence for the user.
+      docs: the names of the docs involved.
+      days: the days involved.
+    """
+
+    kind: str
+    message: str
+    docs: tuple = ()
+    days: tuple = ()
+
+
+def as_json(conflicts):
+    """Returns conflicts as JSON-ready dicts for the request stats."""
+    return [
+        dict(conflict._asdict(), docs=list(conflict.docs), days=list(conflict.days))
+        for conflict in conflicts
+    ]
+
+
+def works_one_shift(doc, prefer_double_shifts):
+    """Returns whether build_model limits `doc` to one shift a day."""
+    return doc in prefer_double_shifts and not prefer_double_shifts[doc]
+
+
+def capacity(one_shift, num_days, rules=DEFAULT_RULES):
+    """Returns the most shifts a doc can work over the horizon.
+
+    Only the one-shift-a-day limit and the forbidden transitions are
+    counted, so this is an upper bound.
+    """
+    options = [(), (MORNING,), (NIGHT,)]
+    if not one_shift:
+        options.append((MORNING, NIGHT))
+    forbidden = {(p, n) for p, n, penalty in rules.penalized_transitions if penalty == 0}
+
+    def shifts(option):
+        # Off days only exist as a shift for one-shift docs.
+        return option or ((OFF,) if one_shift else ())
+
+    # best[option]: the most shifts worked up to a day that ends on option.
+    best = {option: len(option) for option in options}
+    for _ in range(1, num_days):
+        following = {}
+        for option in options:
+            worked = [
+                total for previous, total in best.items()
+                if not any((p, n) in forbidden for p in shifts(previous) for n in shifts(option))
+            ]
+            if worked:
+                following[option] = max(worked) + len(option)
+        best = following
+    return max(best.values(), default=0)
+
+
+def precheck(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    rules=None,
+):
+    """Checks a request with counting bounds before it is solved.
+
+    Args:
+      docs, desired_total_shifts, preferences, unavailable,
+      prefer_double_shifts, max_unfilled, num_days: as for
+        solve.solve_shift_scheduling.
+      rules: the rules.Rules of the model, DEFAULT_RULES if None.
+
+    Returns:
+      a (conflicts, warnings) pair of Conflict lists. Any conflict makes the
+      request infeasible; warnings name days every doc asked to have off,
+      which only costs penalties since unavailability is soft.
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+    compiled = compile_rules(rules, num_days)
+    conflicts = []
+    warnings = []
+
+    supply = max_unfilled
+    for doc in docs:
+        desired_min, desired_max = desired_total_shifts[doc]
+        most = capacity(works_one_shift(doc, prefer_double_shifts), num_days, rules)
+        if desired_min > desired_max:
+            conflicts.append(Conflict(
+                "bounds", "%s's min (%i) is above their max (%i)." % (doc, desired_min, desired_max),
+                (doc,),
+            ))
+        elif desired_min > most:
+            conflicts.append(Conflict(
+                "capacity", "%s can work at most %i shifts in %i days but their min is %i."
+                % (doc, most, num_days, desired_min),
+                (doc,),
+            ))
+        supply += min(desired_max, most)
+
+    demand = sum(sum(day) for day in compiled.day_demands)
+    if supply < demand:
+        conflicts.append(Conflict(
+            "cover", "%i shifts need covering but the docs' max totals and the %i allowed "
+            "unfilled shifts cover at most %i." % (demand, max_unfilled, supply),
+            tuple(docs),
+        ))
+
+    # Each doc covers one shift of a day, or both if allowed; the UNFILLED
+    # doc takes what is left, at most one of each shift.
+    per_day = sum(1 if works_one_shift(doc, prefer_double_shifts) else 2 for doc in docs)
+    uncoverable = []
+    shortfall = 0
+    for d, day in enumerate(compiled.day_demands):
+        short = max(0, sum(day) - per_day)
+        if short > NUM_SHIFTS - 1 or max(day) > len(docs) + 1:
+            uncoverable.append(d)
+        shortfall += short
+    if uncoverable:
+        conflicts.append(Conflict(
+            "cover", "There are not enough docs to cover these days.", (), tuple(uncoverable),
+        ))
+    elif shortfall > max_unfilled:
+        short_days = tuple(d for d, day in enumerate(compiled.day_demands) if sum(day) > per_day)
+        conflicts.append(Conflict(
+            "unfilled", "%i shifts on these days have no doc to cover them, more than the "
+            "%i allowed unfilled shifts." % (shortfall, max_unfilled),
+            (), short_days,
+        ))
+
+    unavailable_days = tuple(
+        d for d in range(num_days)
+        if docs and all((d, MORNING) in unavailable.get(doc, ()) for doc in docs)
+    )
+    if unavailable_days:
+        warnings.append(Conflict("unavailable", "Every doc is unavailable on these days.", (), unavailable_days))
+    return conflicts, warnings
+
+
+def unsat_core(
+    docs,
+    desired_total_shifts,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    rules=None,
+    max_time=CORE_TIME,
+):
+    """Returns the Conflicts of an infeasible subset of the hard constraints.
+
+    Preferences and unavailability are soft, so they are left out; the
+    result is empty if the hard constraints are feasible on their own or no
+    subset is found within `max_time` seconds.
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+    compiled = compile_rules(rules, num_days)
+    model = cp_model.CpModel()
+    num_docs = len(docs)
+    # The last row is the UNFILLED doc.
+    work = [
+        [[model.NewBoolVar("") for d in range(num_days)] for s in range(NUM_SHIFTS)]
+        for e in range(num_docs + 1)
+    ]
+    conflicts = {}
+    # The cover demands of the core are reported once per shift.
+    cover = {}
+
+    def assumption(conflict):
+        lit = model.NewBoolVar("")
+        model.AddAssumption(lit)
+        conflicts[lit.Index()] = conflict
+        return lit
+
+    for e, doc in enumerate(docs):
+        desired_min, desired_max = desired_total_shifts[doc]
+        total = cp_model.LinearExpr.Sum(work[e][MORNING] + work[e][NIGHT])
+        lit = assumption(Conflict(
+            "bounds", "%s must work between %i and %i shifts." % (doc, desired_min, desired_max),
+            (doc,),
+        ))
+        model.AddLinearConstraint(total, desired_min, desired_max).OnlyEnforceIf(lit)
+
+        one_shift = works_one_shift(doc, prefer_double_shifts)
+        # Off days are unconstrained for the others, as in build_model.
+        shifts = range(NUM_SHIFTS) if one_shift else (MORNING, NIGHT)
+        lit = assumption(Conflict("rules", "%s's shift rules." % doc, (doc,)))
+        for d in range(num_days):
+            if one_shift:
+                model.Add(sum(work[e][s][d] for s in range(NUM_SHIFTS)) == 1).OnlyEnforceIf(lit)
+        for previous_shift, next_shift, penalty in rules.penalized_transitions:
+            if penalty == 0 and previous_shift in shifts and next_shift in shifts:
+                for d in range(num_days - 1):
+                    model.AddBoolOr(
+                        [work[e][previous_shift][d].Not(), work[e][next_shift][d + 1].Not()]
+                    ).OnlyEnforceIf(lit)
+        for rule in rules.shift_constraints:
+            if rule.shift not in shifts:
+                continue
+            works = work[e][rule.shift]
+            for length in range(1, rule.hard_min):
+                for start in range(num_days - length + 1):
+                    model.AddBoolOr(solve.negated_bounded_span(works, start, length)).OnlyEnforceIf(lit)
+            for start in range(num_days - rule.hard_max):
+                model.AddBoolOr(
+                    [works[i].Not() for i in range(start, start + rule.hard_max + 1)]
+                ).OnlyEnforceIf(lit)
+        for rule in rules.weekly_sum_constraints:
+            if rule.shift not in shifts:
+                continue
+            for week_start, week_end in compiled.weeks:
+                model.AddLinearConstraint(
+                    cp_model.LinearExpr.Sum(work[e][rule.shift][week_start:week_end]),
+                    rule.hard_min, rule.hard_max,
+                ).OnlyEnforceIf(lit)
+
+    unfilled = work[num_docs]
+    lit = assumption(Conflict(
+        "unfilled", "At most %i shifts may stay unfilled." % max_unfilled,
+    ))
+    model.Add(cp_model.LinearExpr.Sum(unfilled[MORNING] + unfilled[NIGHT]) <= max_unfilled).OnlyEnforceIf(lit)
+
+    for d in range(num_days):
+        for s in (MORNING, NIGHT):
+            demand = compiled.day_demands[d][s - 1]
+            if demand == 0:
+                continue
+            lit = model.NewBoolVar("")
+            model.AddAssumption(lit)
+            cover[lit.Index()] = s, d
+            model.Add(sum(work[e][s][d] for e in range(num_docs + 1)) >= demand).OnlyEnforceIf(lit)
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = max_time
+    # Infeasible subsets are only reported by a single worker.
+    solver.parameters.num_workers = 1
+    if solver.Solve(model) != cp_model.INFEASIBLE:
+        return []
+    core = solver.SufficientAssumptionsForInfeasibility()
+    found = [conflicts[index] for index in core if index in conflicts]
+    uncovered = {MORNING: [], NIGHT: []}
+    for index in core:
+        if index in cover:
+            s, d = cover[index]
+            uncovered[s].append(d)
+    for s, days in uncovered.items():
+        if days:
+            found.append(Conflict(
+                "cover", "The %s shifts of these days cannot all be covered." % SHIFT_NAMES[s],
+                (), tuple(sorted(days)),
+            ))
+    return found
+
+
+def main():
+    with open(sys.argv[1]) as f:
+        inputs = solve.process_inputs(f.read())
+    num_days = int(sys.argv[2])
+    docs, desired, preferred, unavailable, prefer_double = inputs
+    conflicts, warnings = precheck(*inputs, solve.MAX_UNFILLED, num_days)
+    if not conflicts:
+        conflicts = unsat_core(docs, desired, prefer_double, solve.MAX_UNFILLED, num_days)
+    print(json.dumps({"conflicts": as_json(conflicts), "warnings": as_json(warnings)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -168,6 +168,8 @@ let docs = {
     ]
 };
 let currentDoc = null;
+// Last generated schedule per month, used to warm-start the next solve.
+let schedules = {};
 
 function docIndex(date) {
     const currentYear = date.getFullYear();
@@ -379,32 +381,140 @@ function validate(shifts, docs) {
 function exportSchedule() {
 }
 
+// Aborts the solve in progress, if any.
+let solveController = null;
+// The server-side job of the running solve and this page's subscription
+// to it, when served by server.py.
+let solveJob = null;
+
+// Stops the running solve, on the server too when it runs as a job.
+function cancelSolve() {
+    solveController.abort();
+    solveController = null;
+    if (solveJob !== null) {
+        const query = new URLSearchParams({ "subscription": solveJob["subscription"] });
+        fetch(`jobs/${solveJob["id"]}?${query}`, { method: "DELETE" }).catch(() => {});
+        solveJob = null;
+    }
+}
+
+function showSchedule(data) {
+    calendarState = SHOW_SCHEDULE;
+    schedule = data;
+    rebuildCalendar(currentDate, data, currentDocs().map(doc => doc["name"]), null);
+}
+
+// `diagnosis` lists the reasons, if known, why no schedule is possible.
+function finishSchedule(data, idx, diagnosis) {
+    solveController = null;
+    document.querySelector("#spinner").classList.add("hidden");
+    document.querySelector("#accept").disabled = true;
+    showSchedule(data);
+    if (!data.length) {
+        document.querySelector("#export").disabled = true;
+        if (diagnosis && diagnosis.length) {
+            const reasons = diagnosis.map(conflict => {
+                const days = conflict["days"].length ? ` (days ${conflict["days"].map(d => d + 1).join(", ")})` : "";
+                return `- ${conflict["message"]}${days}`;
+            });
+            alert(`No schedule possible:\n${reasons.join("\n")}`);
+        } else {
+            alert("No schedule possible—too many unfilled shifts.");
+        }
+    } else {
+        schedules[idx] = data;
+        validate(schedule, currentDocs());
+        document.querySelector("#export").disabled = false;
+    }
+}
+
+// Keeps the best schedule found so far and cancels the rest of the solve.
+function acceptSchedule() {
+    if (solveController !== null && schedule !== null) {
+        cancelSolve();
+        finishSchedule(schedule, docIndex(currentDate));
+    }
+}
+
 function createSchedule() {
     markActiveDoc(null);
+    if (solveController !== null) {
+        cancelSolve();
+    }
+    const controller = new AbortController();
+    solveController = controller;
 
     const spinner = document.querySelector("#spinner");
     spinner.classList.remove("hidden");
 
     const days = daysInMonth(currentDate.getMonth(), currentDate.getYear());
-    fetch(`cgi-bin/solve-cgi.py?days=${days}`, {
+    const idx = docIndex(currentDate);
+    // Start from this month's last schedule, or last month's after a clone.
+    let hint = schedules[idx] || schedules[docIndex(calcPrevMonth(currentDate))] || null;
+    // A schedule naming docs since removed is no valid hint.
+    const numDocs = currentDocs().length;
+    if (hint && hint.some(day => day.some(doc => doc !== null && doc >= numDocs))) {
+        hint = null;
+    }
+    schedule = null;
+    fetch(`cgi-bin/solve-cgi.py?days=${days}&stream=1`, {
         method: "POST",
         headers: {
             "Content-Type": "application/json",
         },
-        body: JSON.stringify(currentDocs()),
-    }).then(response => response.json())
-        .then(data => {
-            calendarState = SHOW_SCHEDULE;
-            schedule = data;
-            rebuildCalendar(currentDate, data, currentDocs().map(doc => doc["name"]), null);
-            spinner.classList.add("hidden");
-            if (!data.length) {
-                document.querySelector("#export").disabled = true;
-                alert("No schedule possible—too many unfilled shifts.");
-            } else {
-                validate(schedule, currentDocs());
-                document.querySelector("#export").disabled = false;
+        body: JSON.stringify({"docs": currentDocs(), "hint": hint}),
+        signal: controller.signal,
+    }).then(async response => {
+        // The response is one JSON object per line: each improving schedule,
+        // then the final one marked "done".
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split("\n");
+            buffered = lines.pop();
+            for (const line of lines) {
+                if (!line) {
+                    continue;
+                }
+                const event = JSON.parse(line);
+                if (event["error"]) {
+                    throw new Error(event["error"]);
+                }
+                if (event["job"]) {
+                    solveJob = { "id": event["job"], "subscription": event["subscription"] };
+                    continue;
+                }
+                if (event["done"]) {
+                    solveJob = null;
+                    finishSchedule(event["schedule"], idx, event["stats"]["diagnosis"]);
+                    if (event["stats"]["fallback"]) {
+                        alert("No schedule meets every constraint in time; showing a best-effort one.");
+                    }
+                    return;
+                }
+                // A greedy preview comes before the first solution; the
+                // search is still running.
+                if (!event["preview"]) {
+                    spinner.classList.add("hidden");
+                }
+                document.querySelector("#accept").disabled = false;
+                showSchedule(event["schedule"]);
             }
-        })
+        }
+    }).catch(error => {
+        if (controller.signal.aborted) {
+            return;
+        }
+        solveController = null;
+        solveJob = null;
+        spinner.classList.add("hidden");
+        document.querySelector("#accept").disabled = true;
+        alert(`Scheduling failed: ${error.message}`);
+    });
 }
-
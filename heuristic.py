@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Greedy schedules for when CP-SAT has no answer (yet).
+
+greedy_schedule fills the shifts day by day in one pass over the docs per
+shift, so it answers in milliseconds where a solve takes seconds. Each
+shift goes to an allowed doc, in order of preference:
+  1. docs still below their min total,
+  2. double-shift docs already on the day's other shift,
+  3. docs who prefer the day,
+  4. docs furthest from their min, then those who worked least.
+A doc is allowed unless it reached its max, is unavailable that day,
+already works that day without prefer_double, or would break a forbidden
+transition (NIGHT -> MORNING by default) or a hard rule maximum. Shifts
+no doc is allowed on stay unfilled.
+
+The result is a preview shown before the first solution, a hint for the
+exact solve, a starting point for lns.py and the answer of last resort
+when a solve finds nothing. It is not optimal and may leave docs below
+their min or more shifts unfilled than MAX_UNFILLED; its stats say so.
+
+    python3 heuristic.py inputs.json 31
+"""
+
+import json
+import sys
+import time
+
+import solve
+from rules import OFF, MORNING, NIGHT, UNFILLED, DEFAULT_RULES, compile_rules
+
+# Status of a heuristic schedule, in place of a CP-SAT status name.
+HEURISTIC = "HEURISTIC"
+
+
+def greedy_schedule(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    rules=None,
+):
+    """Returns a greedy solve.Schedule; see the module docstring.
+
+    The arguments are as for solve.solve_shift_scheduling. Shifts demanding
+    more than one doc get one, as the schedule format only names one.
+
+    Returns:
+      a solve.Schedule with status HEURISTIC and the docs' totals. Its stats
+      hold solve_time, the number of `unfilled` shifts, `below_min`, the
+      names of the docs under their min, and `feasible`, whether neither
+      the mins nor max_unfilled are broken.
+    """
+    start = time.perf_counter()
+    if rules is None:
+        rules = DEFAULT_RULES
+    compiled = compile_rules(rules, num_days)
+    forbidden = {
+        (previous_shift, next_shift)
+        for previous_shift, next_shift, penalty in rules.penalized_transitions
+        if penalty == 0 and OFF not in (previous_shift, next_shift)
+    }
+    # shift -> the longest run, and the most days a week.
+    max_run = {}
+    for rule in rules.shift_constraints:
+        max_run[rule.shift] = min(rule.hard_max, max_run.get(rule.shift, num_days))
+    max_weekly = {}
+    for rule in rules.weekly_sum_constraints:
+        max_weekly[rule.shift] = min(rule.hard_max, max_weekly.get(rule.shift, 7))
+    week_of = [w for w, (first, last) in enumerate(compiled.weeks) for d in range(first, last)]
+
+    num_docs = len(docs)
+    lows = [desired_total_shifts[doc][0] for doc in docs]
+    highs = [desired_total_shifts[doc][1] for doc in docs]
+    double = [bool(prefer_double_shifts.get(doc)) for doc in docs]
+    wanted = [set(preferences.get(doc, ())) for doc in docs]
+    avoided = [set(unavailable.get(doc, ())) for doc in docs]
+
+    worked = [0] * num_docs
+    # The shifts each doc worked the day before, and its current runs.
+    yesterday = [() for e in range(num_docs)]
+    runs = [{MORNING: 0, NIGHT: 0} for e in range(num_docs)]
+    weekly = [{} for e in range(num_docs)]
+    days = []
+    unfilled = 0
+    for d in range(num_days):
+        day = [None, None]
+        week = week_of[d]
+        for s in (MORNING, NIGHT):
+            if compiled.day_demands[d][s - 1] == 0:
+                continue
+            # The doc on the day's other shift.
+            other = day[NIGHT - s]
+            best, best_key = None, None
+            for e in range(num_docs):
+                if worked[e] >= highs[e] or (d, s) in avoided[e]:
+                    continue
+                if other == e and not double[e]:
+                    continue
+                if any((previous, s) in forbidden for previous in yesterday[e]):
+                    continue
+                if runs[e][s] >= max_run.get(s, num_days):
+                    continue
+                if weekly[e].get((s, week), 0) >= max_weekly.get(s, 7):
+                    continue
+                deficit = lows[e] - worked[e]
+                key = (
+                    deficit <= 0,
+                    not (double[e] and other == e),
+                    (d, s) not in wanted[e],
+                    -deficit,
+                    worked[e],
+                )
+                if best_key is None or key < best_key:
+                    best, best_key = e, key
+            if best is None:
+                unfilled += 1
+                continue
+            day[s - 1] = best
+            worked[best] += 1
+            weekly[best][s, week] = weekly[best].get((s, week), 0) + 1
+        for e in range(num_docs):
+            shifts = tuple(s for s in (MORNING, NIGHT) if day[s - 1] == e)
+            if shifts or yesterday[e]:
+                for s in (MORNING, NIGHT):
+                    runs[e][s] = runs[e][s] + 1 if s in shifts else 0
+                yesterday[e] = shifts
+        days.append(day)
+
+    below_min = [doc for e, doc in enumerate(docs) if worked[e] < lows[e]]
+    stats = {
+        "status": HEURISTIC,
+        "solve_time": time.perf_counter() - start,
+        "objective": None,
+        "unfilled": unfilled,
+        "below_min": below_min,
+        "feasible": not below_min and unfilled <= max_unfilled,
+    }
+    return solve.Schedule(days, HEURISTIC, stats, list(docs) + [UNFILLED], worked + [unfilled])
+
+
+def main():
+    with open(sys.argv[1]) as f:
+        inputs = solve.process_inputs(f.read())
+    schedule = greedy_schedule(*inputs, solve.MAX_UNFILLED, int(sys.argv[2]))
+    print(json.dumps({"status": schedule.status, "schedule": schedule, "stats": schedule.stats}))
+
+
+if __name__ == "__main__":
+    main()
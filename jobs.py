@@ -0,0 +1,309 @@
+"""Queue of solve jobs for the solver service.
+
+Solves are CPU-heavy, so the queue runs at most `cpu_budget //
+threads_per_solve` of them at once, each with `threads_per_solve` CP-SAT
+workers; the rest wait their turn. A request identical to one already
+queued or running (same cache key) joins that job instead of starting a
+new solve. Each request that joins gets its own subscription token, and
+a job is cancelled once every subscription has let go, which stops a
+running search through the solver callback.
+
+A new job publishes a greedy preview schedule (see heuristic.py) as soon
+as it is queued. Once `max_queued` jobs are waiting, new requests are
+answered with that greedy schedule right away instead of being queued.
+"""
+
+import collections
+import concurrent.futures
+import itertools
+import os
+import secrets
+import threading
+import time
+
+import service
+
+# CP-SAT workers given to each solve.
+THREADS_PER_SOLVE = 4
+
+# Expected duration of a solve before any has finished, a rough guess:
+# the balanced policy's time limit, 1 s + 1 ms per variable, for a
+# month of 30 docs (about 3500 variables).
+INITIAL_SOLVE_TIME = 4.5
+
+# Weight of the latest solve in the moving average of solve durations.
+SOLVE_TIME_WEIGHT = 0.2
+
+# Number of finished jobs kept for the status endpoints.
+HISTORY = 256
+
+
+class Job:
+    """One solve, shared by every request that joined it.
+
+    Attributes:
+      id: the job id used by the /jobs endpoints.
+      key: the cache key of the request, None if it cannot be shared.
+      status: "queued", "running", "done", "failed" or "cancelled".
+      cancel: a threading.Event set when the solve should stop.
+      subscriptions: the tokens of the requests still waiting on the job.
+      events: the stream events published so far; the last one of a
+        finished job is marked "done".
+    """
+
+    def __init__(self, job_id, key):
+        self.id = job_id
+        self.key = key
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel = threading.Event()
+        self.subscriptions = set()
+        self.events = []
+        self.changed = threading.Condition()
+        self.done_callbacks = []
+
+    def subscribe(self):
+        """Returns a new subscription token; call with the queue's lock."""
+        subscription = secrets.token_urlsafe(12)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def publish(self, event):
+        with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+            callbacks = self.done_callbacks if event.get("done") else ()
+        for callback in callbacks:
+            callback(event)
+
+    def add_done_callback(self, callback):
+        """Calls `callback` with the job's last event once it finishes,
+        right away if it already has.
+        """
+        with self.changed:
+            if not (self.events and self.events[-1].get("done")):
+                self.done_callbacks.append(callback)
+                return
+            event = self.events[-1]
+        callback(event)
+
+    def next_event(self, index, timeout=None):
+        """Returns events[index], waiting up to `timeout` seconds for it.
+
+        Returns None if it is not published by then.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.events) > index, timeout)
+            return self.events[index] if len(self.events) > index else None
+
+    def final_event(self):
+        """Waits for the job to finish and returns its last event."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.events and self.events[-1].get("done"))
+            return self.events[-1]
+
+    def describe(self):
+        """Returns the job's status as a JSON-ready dict.
+
+        It carries the latest event, i.e. the best schedule so far or the
+        final one.
+        """
+        with self.changed:
+            latest = self.events[-1] if self.events else None
+        return {
+            "id": self.id,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "subscribers": len(self.subscriptions),
+            "latest": latest,
+        }
+
+
+class JobQueue:
+    """Runs solve jobs within a CPU budget; see the module docstring."""
+
+    def __init__(self, cpu_budget=None, threads_per_solve=THREADS_PER_SOLVE, max_queued=None):
+        cpu_budget = cpu_budget or os.cpu_count() or 1
+        self.threads_per_solve = max(1, min(threads_per_solve, cpu_budget))
+        self.slots = max(1, cpu_budget // self.threads_per_solve)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.slots)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        # id -> Job, in submission order.
+        self.jobs = collections.OrderedDict()
+        # key -> queued or running Job.
+        self.in_flight = {}
+        self.solve_time = INITIAL_SOLVE_TIME
+        self.max_queued = max_queued
+
+    def submit(self, body, query):
+        """Queues a request, or joins the identical one in flight.
+
+        Args:
+          body, query: as for service.solve_request.
+
+        Returns:
+          (job, subscription): the Job and the token with which this request
+          lets go of it, see release. Invalid requests raise the errors of
+          service.solve_request before anything is queued. When the queue is
+          full, the job is already done and answers with the greedy
+          schedule, whose stats are marked "degraded".
+        """
+        num_days = service.parse_days(query)
+        doc_list, options = service.parse_body(body)
+        return self.submit_payload(doc_list, num_days, options)
+
+    def submit_payload(self, doc_list, num_days, options):
+        """Queues an already decoded request; see submit."""
+        # Parsed once: the key, the preview and the solve share the Request.
+        request = service.parse_request(doc_list, num_days, options)
+        key = service.request_key(request)
+        preview = service.preview_payload(request)
+        with self.lock:
+            job = self.in_flight.get(key) if key is not None else None
+            if job is not None:
+                return job, job.subscribe()
+            job = Job(str(next(self.ids)), key)
+            subscription = job.subscribe()
+            self.jobs[job.id] = job
+            statuses = collections.Counter(other.status for other in self.jobs.values())
+            # Jobs that will wait for a slot, this one included.
+            waiting = statuses["queued"] - max(0, self.slots - statuses["running"])
+            degraded = (
+                preview is not None and self.max_queued is not None and waiting > self.max_queued
+            )
+            if degraded:
+                job.status = "done"
+                job.started = job.finished = time.time()
+            elif key is not None:
+                self.in_flight[key] = job
+            self.trim()
+        if degraded:
+            preview.stats["degraded"] = True
+            job.publish(service.final_event(preview))
+            return job, subscription
+        if preview is not None:
+            job.publish(service.progress_event(None, preview))
+        self.executor.submit(self.run, job, request)
+        return job, subscription
+
+    def run(self, job, request):
+        with self.lock:
+            if job.status != "queued":
+                return
+            job.status = "running"
+            job.started = time.time()
+
+        def listener(objective, schedule):
+            job.publish(service.progress_event(objective, schedule))
+
+        try:
+            # The preview was published when the job was queued.
+            result = service.solve_parsed(
+                request, listener, job.cancel, self.threads_per_solve, preview=False
+            )
+            event = service.final_event(result)
+            status = "cancelled" if job.cancel.is_set() else "done"
+            solved = not result.stats.get("cached") and "solve_time" in result.stats
+        except (KeyError, ValueError, TypeError) as e:
+            event = {"error": "bad request: %s" % e, "done": True}
+            status, solved = "failed", False
+        except Exception as e:
+            event = {"error": "solve failed: %s" % e, "done": True}
+            status, solved = "failed", False
+        with self.lock:
+            job.status = status
+            job.finished = time.time()
+            # Cache hits and precheck rejections say nothing of solve times.
+            if status == "done" and solved:
+                self.solve_time += SOLVE_TIME_WEIGHT * (
+                    job.finished - job.started - self.solve_time
+                )
+            self.forget(job)
+        job.publish(event)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def release(self, job, subscription):
+        """Lets go of a job for the request holding `subscription`; the last
+        one cancels it.
+
+        A queued job is dropped right away; a running one stops its search
+        and publishes the best schedule found. Releasing the same
+        subscription again does nothing.
+
+        Returns:
+          whether `subscription` was one of the job's.
+        """
+        with self.lock:
+            if subscription not in job.subscriptions:
+                return False
+            job.subscriptions.discard(subscription)
+            if job.finished is not None or job.subscriptions:
+                return True
+            job.cancel.set()
+            self.forget(job)
+            if job.status != "queued":
+                return True
+            job.status = "cancelled"
+            job.finished = time.time()
+        job.publish({"status": "CANCELLED", "schedule": [], "stats": {}, "done": True})
+        return True
+
+    def forget(self, job):
+        # Later identical requests start a new job rather than join this one.
+        if job.key is not None and self.in_flight.get(job.key) is job:
+            del self.in_flight[job.key]
+
+    def trim(self):
+        finished = [job.id for job in self.jobs.values() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - HISTORY)]:
+            del self.jobs[job_id]
+
+    def position(self, job):
+        """Returns how many queued jobs are ahead of `job`."""
+        with self.lock:
+            ahead = 0
+            for other in self.jobs.values():
+                if other is job:
+                    return ahead
+                ahead += other.status == "queued"
+            return ahead
+
+    def expected_wait(self, ahead):
+        """Estimates the seconds before a job with `ahead` queued jobs
+        before it starts, from the moving average of solve durations.
+        """
+        with self.lock:
+            running = sum(job.status == "running" for job in self.jobs.values())
+            if running + ahead < self.slots:
+                return 0.0
+            return self.solve_time * (ahead // self.slots + 1)
+
+    def summary(self):
+        """Returns the queue's load as a JSON-ready dict."""
+        with self.lock:
+            statuses = collections.Counter(job.status for job in self.jobs.values())
+        return {
+            "slots": self.slots,
+            "threads_per_solve": self.threads_per_solve,
+            "running": statuses["running"],
+            "queued": statuses["queued"],
+            "average_solve_time": self.solve_time,
+            "expected_wait": self.expected_wait(statuses["queued"]),
+        }
+
+    def report(self, job):
+        """Returns a job's status with its place in the queue."""
+        report = job.describe()
+        if job.status == "queued":
+            ahead = self.position(job)
+            report["position"] = ahead
+            report["expected_wait"] = self.expected_wait(ahead)
+        return report
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Large neighborhood search for rosters too big for one solve.
+
+With hundreds of docs, a single CP-SAT search tends to stall at a weak
+first schedule. solve_lns instead starts from a schedule and improves it
+piece by piece: each round fixes every assignment except those in a few
+neighborhoods (a window of days, a random set of docs, or the docs with
+the worst penalties), re-solves these small sub-models in parallel and
+keeps the best improvement. All sub-models share the full objective, so
+any improvement on one is an improvement on the whole schedule.
+
+    python3 lns.py inputs.json 31 --time 60
+"""
+
+import argparse
+import concurrent.futures
+import copy
+import json
+import os
+import random
+import sys
+import time
+
+import heuristic
+import solve
+from rules import MORNING, NIGHT
+
+# Kinds of neighborhoods, tried in turn.
+NEIGHBORHOODS = ("window", "docs", "penalties")
+
+# Days freed by a window neighborhood; a week keeps weekly rules whole.
+WINDOW_DAYS = 7
+
+# Share of the docs freed by the doc neighborhoods, and the least number.
+DOC_SHARE = 0.1
+MIN_FREE_DOCS = 2
+
+# Neighborhoods solved at once in each round.
+PARALLEL = 4
+
+# Each neighborhood solve is short: small models settle quickly.
+NEIGHBORHOOD_POLICY = solve.StopPolicy(max_time=10.0, stall_time=2.0)
+
+# Used to find a first schedule when the start cannot be repaired: the LNS
+# rounds improve it faster than the full search once its first solutions
+# stop improving.
+START_POLICY = solve.StopPolicy(max_time=60.0, stall_time=0.5)
+
+
+def solve_lns(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    start=None,
+    max_time=60.0,
+    parallel=PARALLEL,
+    num_workers=None,
+    neighborhoods=NEIGHBORHOODS,
+    seed=0,
+    listener=None,
+    cancel=None,
+    rules=None,
+):
+    """Improves a schedule by re-solving neighborhoods of it.
+
+    Args:
+      docs, desired_total_shifts, preferences, unavailable,
+      prefer_double_shifts, max_unfilled, num_days, rules: as for
+        solve.solve_shift_scheduling.
+      start: the schedule to start from, in the format returned; the
+        greedy schedule of heuristic.py by default. It is first re-solved
+        with only the docs below their min free; if that fails, it hints a
+        full solve with START_POLICY.
+      max_time: the seconds allowed for the whole search.
+      parallel: the number of neighborhoods solved at once.
+      num_workers: the CP-SAT workers of each neighborhood solve; the
+        cores are shared between them by default.
+      neighborhoods: the kinds of neighborhoods to try, see NEIGHBORHOODS.
+      seed: the random seed, so that runs are reproducible.
+      listener: called with (objective, schedule) for each improvement.
+      cancel: a threading.Event that stops the search when set.
+
+    Returns:
+      the best solve.Schedule found. Its status is only OPTIMAL if the
+      first schedule was proven optimal. Its stats carry `rounds`,
+      `improvements` and `trajectory`, the [seconds, objective,
+      neighborhood] of the start and each improvement; solve_time covers
+      the whole search.
+    """
+    began = time.perf_counter()
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 1) // parallel)
+    shift_model = solve.build_model(
+        docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+        max_unfilled, num_days, rules=rules,
+    )
+
+    status = "FEASIBLE"
+    if start is None:
+        start = heuristic.greedy_schedule(
+            docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+            max_unfilled, num_days, rules,
+        )
+    worked = [0] * len(docs)
+    for day in start:
+        for e in day:
+            if e is not None and 0 <= e < len(docs):
+                worked[e] += 1
+    short = [e for e, doc in enumerate(docs) if worked[e] < desired_total_shifts[doc][0]]
+    shift_model.set_hint(start)
+    fixed = fix_outside(shift_model, start, short, ())
+    incumbent = solve.solve_model(fixed, NEIGHBORHOOD_POLICY, num_workers, cancel=cancel)
+    if not incumbent:
+        incumbent = solve.solve_model(
+            shift_model, START_POLICY.with_max_time(max_time), cancel=cancel
+        )
+        if incumbent.status == "OPTIMAL":
+            status = "OPTIMAL"
+    if not incumbent:
+        incumbent.stats["solve_time"] = time.perf_counter() - began
+        return incumbent
+
+    objective = incumbent.stats["objective"]
+    trajectory = [[time.perf_counter() - began, objective, "start"]]
+    rng = random.Random(seed)
+    kinds = [kind for kind in NEIGHBORHOODS if kind in neighborhoods]
+    num_free_docs = max(MIN_FREE_DOCS, int(DOC_SHARE * len(docs)))
+    rounds = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+        while status != "OPTIMAL" and not (cancel is not None and cancel.is_set()):
+            remaining = max_time - (time.perf_counter() - began)
+            if remaining <= 0:
+                break
+            policy = NEIGHBORHOOD_POLICY.with_max_time(remaining)
+            shift_model.set_hint(incumbent)
+            futures = {}
+            for i in range(parallel):
+                kind = kinds[(rounds * parallel + i) % len(kinds)]
+                free_docs, free_days = choose_neighborhood(
+                    kind, incumbent, len(docs), num_days, num_free_docs, rng
+                )
+                sub_model = fix_outside(shift_model, incumbent, free_docs, free_days)
+                future = executor.submit(
+                    solve.solve_model, sub_model, policy, num_workers, cancel=cancel
+                )
+                futures[future] = kind
+            rounds += 1
+
+            best, best_kind = None, None
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                if result and result.stats["objective"] < (
+                        best.stats["objective"] if best else objective):
+                    best, best_kind = result, futures[future]
+            if best is None:
+                continue
+            incumbent = best
+            objective = best.stats["objective"]
+            trajectory.append([time.perf_counter() - began, objective, best_kind])
+            if listener is not None:
+                listener(objective, list(incumbent))
+
+    incumbent.status = status
+    incumbent.stats.update({
+        "status": status,
+        "solve_time": time.perf_counter() - began,
+        "rounds": rounds,
+        "improvements": len(trajectory) - 1,
+        "trajectory": trajectory,
+    })
+    return incumbent
+
+
+def choose_neighborhood(kind, schedule, num_docs, num_days, num_free_docs, rng):
+    """Returns the (free_docs, free_days) of a neighborhood of `schedule`.
+
+    A "window" frees every doc on WINDOW_DAYS consecutive days, "docs"
+    frees random docs on every day and "penalties" frees docs drawn from
+    those with the highest penalties in schedule.violations.
+    """
+    if kind == "window":
+        first = rng.randrange(max(1, num_days - WINDOW_DAYS + 1))
+        return (), range(first, min(num_days, first + WINDOW_DAYS))
+    if kind == "penalties":
+        penalties = {}
+        for label, value, coeff, counted in schedule.violations:
+            # Excess cover terms name a shift rather than a doc.
+            if label[0] == "excess_demand" or coeff * value <= 0:
+                continue
+            e = label[1]
+            if e < num_docs:
+                penalties[e] = penalties.get(e, 0) + coeff * value
+        worst = sorted(penalties, key=penalties.get, reverse=True)[:2 * num_free_docs]
+        if len(worst) >= num_free_docs:
+            return rng.sample(worst, num_free_docs), ()
+    return rng.sample(range(num_docs), min(num_docs, num_free_docs)), ()
+
+
+def fix_outside(shift_model, schedule, free_docs, free_days):
+    """Returns a copy of `shift_model` with the schedule's assignments fixed.
+
+    The morning and night variables of every doc outside `free_docs` are
+    fixed to `schedule` on the days outside `free_days`; the UNFILLED doc
+    stays free. The copy shares everything with `shift_model` but its
+    model, a clone whose variable domains are patched, so fixing costs no
+    extra constraints.
+
+    A solve.Schedule's work_values are used when it has them, since its
+    days only name one doc per shift.
+    """
+    sub_model = copy.copy(shift_model)
+    sub_model.model = shift_model.model.Clone()
+    variables = sub_model.model.Proto().variables
+    num_days = shift_model.num_days
+    values = getattr(schedule, "work_values", b"")
+    free_docs = set(free_docs)
+    fixed_days = [d for d in range(num_days) if d not in set(free_days)]
+    work = shift_model.work
+    for e in range(len(shift_model.docs) - 1):
+        if e in free_docs:
+            continue
+        for s in (MORNING, NIGHT):
+            start = (e * len(solve.SHIFTS) + s) * num_days
+            for d in fixed_days:
+                if values:
+                    value = values[start + d]
+                else:
+                    value = 1 if schedule[d][s - 1] == e else 0
+                domain = variables[work[e][s][d].Index()].domain
+                domain.clear()
+                domain.extend((value, value))
+    return sub_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", help="a JSON doc list, as posted by dynamic.js")
+    parser.add_argument("days", type=int)
+    parser.add_argument("--time", type=float, default=60.0, help="seconds for the whole search")
+    parser.add_argument("--parallel", type=int, default=PARALLEL,
+                        help="neighborhoods solved at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with open(args.inputs) as f:
+        inputs = solve.process_inputs(f.read())
+    schedule = solve_lns(
+        *inputs, solve.MAX_UNFILLED, args.days,
+        max_time=args.time, parallel=args.parallel, seed=args.seed,
+    )
+    for seconds, objective, kind in schedule.stats.get("trajectory", ()):
+        sys.stderr.write("%7.2f s  %10i  %s\n" % (seconds, objective, kind))
+    print(json.dumps({"status": schedule.status, "schedule": schedule, "stats": schedule.stats}))
+
+
+if __name__ == "__main__":
+    main()
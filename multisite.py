@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""Scheduling several sites whose docs may rotate between them.
+
+Each site is a roster of its own, with its own cover demands, rules and
+UNFILLED pseudo-doc. A doc listed at several sites, by name, is shared:
+solving the sites one by one would book it twice on the same day or leave
+it short everywhere. Sites linked by shared docs are therefore solved
+together, their models built into one CpModel, with constraints only on
+the shared docs:
+  - each shift of a day is worked at one site at most, and a doc without
+    prefer_double at every one of its sites works one shift a day at most;
+  - a transition forbidden by the rules of any of its sites is forbidden
+    across sites too (penalized transitions only count within a site);
+  - the optional cross-site limits bound its total shifts over all sites.
+The objective is the sum of the sites' objectives. Groups of sites with no
+doc in common are independent; they are solved in parallel, and a site
+alone as an ordinary solve.
+
+A request is an object holding the sites and the limits:
+
+    {"sites": [{"name": "North", "docs": [...], "rules": {...}}, ...],
+     "limits": {"Bowman": [4, 12]}}
+
+where "docs" is a doc list as posted by dynamic.js, "rules" is optional
+(see rules.rules_from_json) and "limits" maps docs to their (min, max)
+shifts over all sites.
+
+    python3 multisite.py sites.json 31
+"""
+
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from typing import NamedTuple
+
+from ortools.sat.python import cp_model
+
+import roster
+import solve
+from rules import OFF, MORNING, NIGHT, rules_from_json
+
+
+class Site(NamedTuple):
+    """A site of a multi-site request.
+
+    Attributes:
+      name: the site name.
+      inputs: the (docs, desired, preferences, unavailable, prefer_double)
+        inputs of solve.build_model for its roster.
+      rules: its rules.Rules.
+    """
+
+    name: str
+    inputs: tuple
+    rules: tuple
+
+
+def parse_sites(payload, num_days):
+    """Returns the (sites, limits) of a decoded multi-site request.
+
+    Raises:
+      ValueError: for a malformed site or limit, a duplicate site name or
+        a limit on a doc of no site; see also roster.parse_roster.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("sites"), list):
+        raise ValueError("a multi-site request must hold a list of sites")
+    sites = []
+    names = set()
+    for entry in payload["sites"]:
+        if not isinstance(entry, dict):
+            raise ValueError("each site must be an object")
+        name = entry["name"]
+        if not isinstance(name, str) or not name or name in names:
+            raise ValueError("site names must be unique non-empty strings")
+        names.add(name)
+        inputs = roster.parse_roster(entry["docs"], num_days).inputs()
+        sites.append(Site(name, inputs, rules_from_json(entry.get("rules"))))
+
+    limits = {}
+    known = {doc for site in sites for doc in site.inputs[0]}
+    for doc, bounds in (payload.get("limits") or {}).items():
+        if doc not in known:
+            raise ValueError("limit on %r, who works at no site" % doc)
+        if (not isinstance(bounds, list) or len(bounds) != 2
+                or any(isinstance(b, bool) or not isinstance(b, int) or b < 0 for b in bounds)
+                or bounds[0] > bounds[1]):
+            raise ValueError("%s's limit must be [min, max]" % doc)
+        limits[doc] = tuple(bounds)
+    return sites, limits
+
+
+def site_groups(sites):
+    """Returns the groups of sites linked by shared docs, as lists of site
+    indices, each in site order.
+    """
+    # Union-find over the sites, merging those with a doc in common.
+    parent = list(range(len(sites)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_site = {}
+    for i, site in enumerate(sites):
+        for doc in site.inputs[0]:
+            j = first_site.setdefault(doc, i)
+            parent[find(i)] = find(j)
+    groups = {}
+    for i in range(len(sites)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values())
+
+
+class MultiSiteModel:
+    """One model for a group of sites.
+
+    Attributes:
+      model: the cp_model.CpModel shared by the sites.
+      site_models: the solve.ShiftModel of each site, in group order.
+      shared: doc name -> the (site_model, doc index) of each of its
+        sites, for the docs at more than one.
+    """
+
+    def __init__(self, model, site_models, shared):
+        self.model = model
+        self.site_models = site_models
+        self.shared = shared
+
+    def minimize(self):
+        """Sets the model objective to the sum of the sites' objectives."""
+        bool_vars, bool_coeffs, int_vars, int_coeffs = [], [], [], []
+        for site_model in self.site_models:
+            bool_vars += site_model.obj_bool_vars
+            bool_coeffs += site_model.obj_bool_coeffs
+            int_vars += site_model.obj_int_vars
+            int_coeffs += site_model.obj_int_coeffs
+        self.model.Minimize(
+            cp_model.LinearExpr.WeightedSum(bool_vars, bool_coeffs)
+            + cp_model.LinearExpr.WeightedSum(int_vars, int_coeffs)
+        )
+
+
+def build_multisite(sites, max_unfilled, num_days, limits=None):
+    """Builds the model of a group of sites; see the module docstring.
+
+    Each site is built by solve.build_model into the shared model, so the
+    cost grows with the sites' sizes plus the shared docs' constraints,
+    which are linear in the number of their sites.
+
+    Returns:
+      a MultiSiteModel.
+    """
+    model = cp_model.CpModel()
+    site_models = []
+    placements = {}
+    for site in sites:
+        site_model = solve.build_model(
+            *site.inputs, max_unfilled, num_days, rules=site.rules, model=model
+        )
+        site_models.append(site_model)
+        for e, doc in enumerate(site_model.docs[:-1]):
+            placements.setdefault(doc, []).append((site, site_model, e))
+
+    limits = limits or {}
+    shared = {}
+    for doc, placed in placements.items():
+        if len(placed) > 1:
+            shared[doc] = [(site_model, e) for site, site_model, e in placed]
+            add_shared_doc(model, doc, placed, num_days)
+        if doc in limits:
+            low, high = limits[doc]
+            model.AddLinearConstraint(
+                cp_model.LinearExpr.Sum([m.total_vars[e] for site, m, e in placed]), low, high
+            )
+
+    multisite_model = MultiSiteModel(model, site_models, shared)
+    multisite_model.minimize()
+    return multisite_model
+
+
+def add_shared_doc(model, doc, placed, num_days):
+    """Adds the cross-site constraints of a doc at several sites.
+
+    Args:
+      placed: the (site, site_model, doc index) of each of its sites.
+    """
+    double = all(site.inputs[4].get(doc) for site, site_model, e in placed)
+    works = {
+        s: [site_model.work[e][s] for site, site_model, e in placed] for s in (MORNING, NIGHT)
+    }
+    for d in range(num_days):
+        if double:
+            for s in (MORNING, NIGHT):
+                model.AddAtMostOne(work[d] for work in works[s])
+        else:
+            model.AddAtMostOne(work[d] for s in (MORNING, NIGHT) for work in works[s])
+
+    forbidden = {
+        (previous_shift, next_shift)
+        for site, site_model, e in placed
+        for previous_shift, next_shift, penalty in site.rules.penalized_transitions
+        if penalty == 0 and OFF not in (previous_shift, next_shift)
+    }
+    for previous_shift, next_shift in sorted(forbidden):
+        # The shift is worked at one site at most, so at most one of these
+        # is true exactly when the transition happens nowhere.
+        for d in range(num_days - 1):
+            model.AddAtMostOne(
+                [work[d] for work in works[previous_shift]]
+                + [work[d + 1] for work in works[next_shift]]
+            )
+
+
+def solve_group(
+    sites, max_unfilled, num_days, limits=None, policy=solve.DEFAULT_POLICY,
+    num_workers=None, cancel=None,
+):
+    """Solves a group of sites in one model.
+
+    Returns:
+      a solve.Schedule per site, as for solve.solve_shift_scheduling. Each
+      site's stats carry its own objective, totals and unfilled shifts;
+      the rest, including the bound and gap, are those of the joint solve,
+      whose objective is stats["group_objective"].
+    """
+    if isinstance(policy, str):
+        policy = solve.POLICIES[policy]
+    start = time.perf_counter()
+    multisite_model = build_multisite(sites, max_unfilled, num_days, limits)
+    build_time = time.perf_counter() - start
+    model = multisite_model.model
+
+    solver = solve.make_solver(model, policy, num_workers)
+    solution_printer = solve.SolutionPrinter(policy, cancel=cancel)
+    start = time.perf_counter()
+    status = solve.run_search(solver, model, solution_printer)
+    stats = solve.solve_stats(
+        solver, status, solution_printer, model, time.perf_counter() - start
+    )
+    stats["group_objective"] = stats.pop("objective")
+    stats.update({
+        "build_time": build_time,
+        "sites": [site.name for site in sites],
+        "shared_docs": sorted(multisite_model.shared),
+    })
+    if stats["group_objective"] is None:
+        return [solve.Schedule([], stats["status"], dict(stats)) for site in sites]
+
+    solution = list(solver.ResponseProto().solution)
+    schedules = []
+    for site_model in multisite_model.site_models:
+        values = site_model.work_values(solution)
+        totals = site_model.totals(values)
+        violations = site_model.violations(solution)
+        site_stats = dict(
+            stats,
+            objective=float(sum(v.value * v.coeff for v in violations)),
+            unfilled=totals[-1],
+        )
+        schedules.append(solve.Schedule(
+            site_model.days(values), stats["status"], site_stats,
+            site_model.docs, totals, violations, values,
+        ))
+    return schedules
+
+
+def solve_multisite(
+    sites,
+    num_days,
+    limits=None,
+    max_unfilled=solve.MAX_UNFILLED,
+    policy=solve.DEFAULT_POLICY,
+    num_workers=None,
+    cancel=None,
+):
+    """Solves every site, groups of sites sharing docs in one model each.
+
+    Args:
+      sites, limits: as returned by parse_sites.
+      num_days, max_unfilled, policy: as for solve.solve_shift_scheduling;
+        max_unfilled applies to each site.
+      num_workers: the CP-SAT workers in total; the cores are shared
+        between the groups solved in parallel by default.
+      cancel: a threading.Event that stops every solve when set.
+
+    Returns:
+      a dict of site name -> solve.Schedule, in site order; see solve_group.
+      A site alone is solved by solve.solve_shift_scheduling and its stats
+      also carry `sites` and `shared_docs`.
+    """
+    groups = site_groups(sites)
+    workers = max(1, (num_workers or os.cpu_count() or 1) // len(groups))
+    limits = limits or {}
+
+    def solve_sites(group):
+        members = [sites[i] for i in group]
+        if len(members) > 1:
+            return solve_group(
+                members, max_unfilled, num_days, limits, policy, workers, cancel
+            )
+        site = members[0]
+        desired = dict(site.inputs[1])
+        for doc, (low, high) in limits.items():
+            # Alone, a doc's limits narrow its bounds at its site.
+            if doc in desired:
+                desired[doc] = (max(low, desired[doc][0]), min(high, desired[doc][1]))
+        inputs = (site.inputs[0], desired) + site.inputs[2:]
+        schedule = solve.solve_shift_scheduling(
+            *inputs, max_unfilled, num_days,
+            policy=policy, num_workers=workers, cancel=cancel, rules=site.rules,
+        )
+        schedule.stats.update({"sites": [site.name], "shared_docs": []})
+        return [schedule]
+
+    schedules = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        for group, results in zip(groups, executor.map(solve_sites, groups)):
+            for i, schedule in zip(group, results):
+                schedules[i] = schedule
+    return {sites[i].name: schedules[i] for i in range(len(sites))}
+
+
+def main():
+    with open(sys.argv[1]) as f:
+        sites, limits = parse_sites(json.load(f), int(sys.argv[2]))
+    schedules = solve_multisite(sites, int(sys.argv[2]), limits)
+    for name, schedule in schedules.items():
+        sys.stderr.write(
+            "%s: %s, %s unfilled, objective %s\n"
+            % (name, schedule.status, schedule.stats.get("unfilled"), schedule.stats.get("objective"))
+        )
+    print(json.dumps({
+        name: {"status": schedule.status, "schedule": schedule, "stats": schedule.stats}
+        for name, schedule in schedules.items()
+    }))
+
+
+if __name__ == "__main__":
+    main()
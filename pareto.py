@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Multi-objective solving: unfilled shifts against everything else.
+
+The weighted objective trades unfilled shifts against double shifts,
+preferences and unavailability through fixed weights. solve_lexicographic
+instead puts unfilled shifts first: it minimizes them, fixes that optimum
+and then minimizes the usual objective. solve_pareto returns the schedules
+on the trade-off between the two, so coordinators can choose between
+"fewer unfilled shifts" and "happier docs".
+
+Both work on a single model; each stage adds a bound on the number of
+unfilled shifts and is hinted with the previous stage's schedule.
+
+    python3 pareto.py inputs.json 31 --points 3
+"""
+
+import argparse
+import json
+import sys
+
+import solve
+
+
+def solve_lexicographic(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    hint=None,
+    policy=solve.DEFAULT_POLICY,
+    num_workers=None,
+    listener=None,
+    cancel=None,
+    rules=None,
+    log_callback=None,
+):
+    """Minimizes unfilled shifts, then the objective among those schedules.
+
+    The arguments are as for solve.solve_shift_scheduling; `policy`
+    applies to each stage and `listener` only sees the second one, while
+    `log_callback` gets the search log of both.
+
+    Returns:
+      the solve.Schedule of the second stage, or of the first if the
+      second finds none in time. Its stats also carry `stages`, the stats
+      of both stages; stats["unfilled"] is only proven minimal if the first
+      stage's status is OPTIMAL.
+    """
+    shift_model = solve.build_model(
+        docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+        max_unfilled, num_days, hint, rules=rules,
+    )
+    model = shift_model.model
+    unfilled = shift_model.unfilled()
+    model.Minimize(unfilled)
+    first = solve.solve_model(
+        shift_model, policy, num_workers, cancel=cancel, log_callback=log_callback
+    )
+    if not first:
+        first.stats["stages"] = [dict(first.stats)]
+        return first
+
+    model.Add(unfilled <= first.stats["unfilled"])
+    shift_model.set_hint(first)
+    shift_model.minimize()
+    second = solve.solve_model(
+        shift_model, policy, num_workers, listener, cancel, log_callback=log_callback
+    )
+    stages = [dict(first.stats), dict(second.stats)]
+    result = second if second else first
+    result.stats["stages"] = stages
+    return result
+
+
+def solve_pareto(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    max_points=3,
+    hint=None,
+    policy=solve.DEFAULT_POLICY,
+    num_workers=None,
+    cancel=None,
+    rules=None,
+    log_callback=None,
+):
+    """Returns up to `max_points` schedules trading unfilled shifts for
+    objective.
+
+    The first schedule minimizes the objective alone; each next one
+    minimizes it with at least one unfilled shift fewer than the last (the
+    epsilon-constraint method), until no shift is unfilled or no schedule
+    is found. A schedule with no better objective than the next is
+    dominated and dropped, so the result is ordered by decreasing unfilled
+    shifts and strictly increasing objective; each is Pareto-optimal when
+    solved to OPTIMAL. If not even the first schedule is found, or
+    `cancel` is set before it is, the list holds that empty one. The other
+    arguments are as for solve.solve_shift_scheduling.
+    """
+    if max_points < 1:
+        raise ValueError("max_points must be at least 1")
+    shift_model = solve.build_model(
+        docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+        max_unfilled, num_days, hint, rules=rules,
+    )
+    unfilled = shift_model.unfilled()
+    front = []
+    while len(front) < max_points:
+        if front and cancel is not None and cancel.is_set():
+            break
+        schedule = solve.solve_model(
+            shift_model, policy, num_workers, cancel=cancel, log_callback=log_callback
+        )
+        if not schedule:
+            if not front:
+                front.append(schedule)
+            break
+        if front and schedule.stats["objective"] <= front[-1].stats["objective"]:
+            front.pop()
+        front.append(schedule)
+        if schedule.stats["unfilled"] == 0:
+            break
+        shift_model.model.Add(unfilled <= schedule.stats["unfilled"] - 1)
+        shift_model.set_hint(schedule)
+    return front
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", help="a JSON doc list, as posted by dynamic.js")
+    parser.add_argument("days", type=int)
+    parser.add_argument("--points", type=int, default=3,
+                        help="the most schedules to return; 1 solves lexicographically")
+    parser.add_argument("--policy", default=solve.DEFAULT_POLICY, choices=sorted(solve.POLICIES))
+    args = parser.parse_args()
+    with open(args.inputs) as f:
+        inputs = solve.process_inputs(f.read())
+    if args.points == 1:
+        schedules = [solve_lexicographic(*inputs, solve.MAX_UNFILLED, args.days, policy=args.policy)]
+    else:
+        schedules = solve_pareto(
+            *inputs, solve.MAX_UNFILLED, args.days, args.points, policy=args.policy
+        )
+    for schedule in schedules:
+        sys.stderr.write(
+            "%s: %s unfilled, objective %s\n"
+            % (schedule.status, schedule.stats.get("unfilled"), schedule.stats["objective"])
+        )
+    print(json.dumps([
+        {"status": schedule.status, "schedule": schedule, "stats": schedule.stats}
+        for schedule in schedules
+    ]))
+
+
+if __name__ == "__main__":
+    main()
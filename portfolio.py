@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Portfolio solving: independent solves in parallel, best result wins.
+
+Each configuration runs solve_shift_scheduling with different CP-SAT
+parameters (seeds and search strategies) in its own process. All of them
+share one wall-clock budget, and the schedule with the best objective is
+returned along with which configuration found it:
+
+    python3 portfolio.py roster.json --days 31 --budget 10
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import solve
+
+# (name, SatParameters overrides)
+CONFIGS = [
+    ("default", {}),
+    ("seed_1", {"random_seed": 1}),
+    ("seed_2", {"random_seed": 2}),
+    ("no_lp", {"linearization_level": 0}),
+    ("full_lp", {"linearization_level": 2}),
+    ("core", {"optimize_with_core": True}),
+    ("fixed_search", {"search_branching": "FIXED_SEARCH"}),
+    ("pseudo_cost", {"search_branching": "PSEUDO_COST_SEARCH"}),
+]
+
+# Statuses in order of preference among results with the same objective.
+STATUS_RANK = {"OPTIMAL": 0, "FEASIBLE": 1}
+
+
+def solve_config(inputs, max_unfilled, num_days, name, parameters, policy, deadline, num_workers):
+    """Runs one configuration until the shared deadline; see solve_portfolio."""
+    remaining = max(0.0, deadline - time.time())
+    schedule = solve.solve_shift_scheduling(
+        *inputs, max_unfilled, num_days,
+        policy=policy.with_max_time(remaining),
+        num_workers=num_workers,
+        parameters=parameters,
+    )
+    return name, list(schedule), schedule.status, schedule.stats
+
+
+def solve_portfolio(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    budget=10.0,
+    configs=None,
+    policy=solve.DEFAULT_POLICY,
+    processes=None,
+):
+    """Solves with every configuration at once and keeps the best schedule.
+
+    Args:
+      docs, desired_total_shifts, preferences, unavailable,
+      prefer_double_shifts, max_unfilled, num_days: as for
+        solve.solve_shift_scheduling.
+      budget: wall-clock seconds shared by the whole portfolio.
+      configs: a list of (name, SatParameters overrides), CONFIGS by default.
+      policy: the stop policy of each solve, capped by the budget.
+      processes: the number of processes, one per config by default.
+
+    Returns:
+      the best solve.Schedule. Its stats["portfolio"] names the `winner`
+      and lists the status and objective of every configuration.
+    """
+    if isinstance(policy, str):
+        policy = solve.POLICIES[policy]
+    configs = configs or CONFIGS
+    processes = processes or len(configs)
+    # Split the cores between the concurrent solves.
+    num_workers = max(1, (os.cpu_count() or 1) // processes)
+    deadline = time.time() + budget
+    inputs = (docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts)
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [
+            pool.submit(
+                solve_config, inputs, max_unfilled, num_days, name, parameters, policy,
+                deadline, num_workers,
+            )
+            for name, parameters in configs
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+
+    def rank(result):
+        _, schedule, status, stats = result
+        if not schedule:
+            return (1, 0, 0)
+        return (0, stats["objective"], STATUS_RANK.get(status, 2))
+
+    results.sort(key=rank)
+    winner, schedule, status, stats = results[0]
+    stats = dict(stats)
+    stats["portfolio"] = {
+        "winner": winner,
+        "results": [
+            {
+                "config": name,
+                "status": config_status,
+                "objective": config_stats.get("objective"),
+                "solve_time": config_stats.get("solve_time"),
+            }
+            for name, _, config_status, config_stats in results
+        ],
+    }
+    return solve.Schedule(schedule, status, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("roster", help="a JSON doc list, as posted by dynamic.js")
+    parser.add_argument("--days", type=int, required=True)
+    parser.add_argument("--budget", type=float, default=10.0)
+    parser.add_argument("--policy", default=solve.DEFAULT_POLICY, choices=sorted(solve.POLICIES))
+    args = parser.parse_args()
+    with open(args.roster) as f:
+        inputs = solve.process_inputs(f.read())
+    schedule = solve_portfolio(
+        *inputs, solve.MAX_UNFILLED, args.days, budget=args.budget, policy=args.policy
+    )
+    for result in schedule.stats["portfolio"]["results"]:
+        sys.stderr.write("%(config)-14s %(status)-10s objective=%(objective)s\n" % result)
+    sys.stderr.write("winner: %s\n" % schedule.stats["portfolio"]["winner"])
+    print(json.dumps(schedule))
+
+
+if __name__ == "__main__":
+    main()
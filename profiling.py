@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Opt-in profiling of slow requests, saved as replayable bundles.
+
+A request is profiled when it carries `"profile": true` or when the
+SCHEDULER_PROFILE environment variable names a directory, which then
+profiles every request. A Recorder runs cProfile over the Python side of
+the solve (model building, solution handling) and collects
+CP-SAT's search progress log, then writes a bundle directory:
+
+    input.json     the request, as {"days": N, "body": {...}}
+    profile.pstats the cProfile statistics, for pstats or snakeviz
+    profile.txt    the functions with the most cumulative time
+    search.log     CP-SAT's search log
+    result.json    the final schedule, status and stats
+
+Bundles go under SCHEDULER_PROFILE, or PROFILE_DIR in the temporary
+directory. A bundle is replayed, and profiled again into a new bundle,
+with:
+
+    python3 profiling.py /tmp/scheduler-profiles/20240101-120000-1a2b3c4d
+"""
+
+import cProfile
+import hashlib
+import io
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+
+PROFILE_ENV = "SCHEDULER_PROFILE"
+
+# Default bundle directory, under the system's temporary directory.
+PROFILE_DIR = "scheduler-profiles"
+
+# Number of functions listed in profile.txt.
+TOP_FUNCTIONS = 40
+
+
+def requested(options):
+    """Returns whether a request's options or the environment ask for a
+    profile.
+    """
+    return bool(options.get("profile") or os.environ.get(PROFILE_ENV))
+
+
+def profile_dir():
+    return os.environ.get(PROFILE_ENV) or os.path.join(tempfile.gettempdir(), PROFILE_DIR)
+
+
+class Recorder:
+    """Profiles one request and writes its bundle.
+
+    Call start() before handling the request, pass `log` as the solver's
+    log_callback, call stop() once it is handled and finish() with the
+    result.
+    """
+
+    def __init__(self, doc_list, num_days, options):
+        body = dict(options, docs=doc_list)
+        body.pop("profile", None)
+        self.request = {"days": num_days, "body": body}
+        self.profiler = cProfile.Profile()
+        self.profiling = False
+        self.lines = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        try:
+            self.profiler.enable()
+            self.profiling = True
+        except ValueError:
+            # Another profiler is active, e.g. that of a concurrent request
+            # on Pythons with one profiler per process; keep the search log.
+            sys.stderr.write("Profiler busy, recording the search log only\n")
+
+    def stop(self):
+        if self.profiling:
+            self.profiler.disable()
+
+    def log(self, line):
+        # Called from CP-SAT's threads.
+        with self.lock:
+            self.lines.append(line)
+
+    def finish(self, schedule):
+        """Writes the bundle.
+
+        Returns:
+          the bundle's path, also stored in schedule.stats["profile"].
+        """
+        encoded = json.dumps(self.request, sort_keys=True).encode("utf-8")
+        name = "%s-%s" % (
+            time.strftime("%Y%m%d-%H%M%S"), hashlib.sha256(encoded).hexdigest()[:8]
+        )
+        path = os.path.join(profile_dir(), name)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "input.json"), "w") as f:
+            json.dump(self.request, f)
+        if self.profiling:
+            self.profiler.dump_stats(os.path.join(path, "profile.pstats"))
+            report = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=report)
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            with open(os.path.join(path, "profile.txt"), "w") as f:
+                f.write(report.getvalue())
+        with open(os.path.join(path, "search.log"), "w") as f:
+            with self.lock:
+                f.writelines(line + "\n" for line in self.lines)
+        schedule.stats["profile"] = path
+        with open(os.path.join(path, "result.json"), "w") as f:
+            json.dump({"status": schedule.status, "schedule": schedule, "stats": schedule.stats}, f)
+        sys.stderr.write("Profile written to %s\n" % path)
+        return path
+
+
+def load_bundle(path):
+    """Returns the (doc_list, num_days, options) of a bundle's request."""
+    with open(os.path.join(path, "input.json")) as f:
+        request = json.load(f)
+    options = dict(request["body"])
+    return options.pop("docs"), request["days"], options
+
+
+def main():
+    # Imported here: service imports this module.
+    import service
+
+    doc_list, num_days, options = load_bundle(sys.argv[1])
+    options["profile"] = True
+    schedule = service.solve_payload(doc_list, num_days, options)
+    path = schedule.stats["profile"]
+    report = os.path.join(path, "profile.txt")
+    if os.path.exists(report):
+        with open(report) as f:
+            sys.stdout.write(f.read())
+    print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Incremental repair of a schedule after a small change.
+
+When a doc marks a day unavailable (or preferred) mid-month, re-solving
+from scratch can reshuffle the whole month. repair_schedule instead keeps
+every assignment outside a neighborhood of the change fixed, penalizes
+changing the assignments inside it, and re-optimizes only that part.
+"""
+
+import time
+
+import solve
+
+# Repairs are interactive: stop quickly once the search settles. max_time
+# bounds the whole repair, widening rounds included.
+REPAIR_POLICY = solve.StopPolicy(max_time=1.0, stall_time=0.2)
+
+# Objective cost of moving an assignment that the change did not require.
+CHANGE_COST = 4
+
+
+def repair_schedule(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    schedule,
+    changed_docs,
+    changed_days,
+    radius=2,
+    change_cost=CHANGE_COST,
+    policy=REPAIR_POLICY,
+    num_workers=None,
+    rules=None,
+    log_callback=None,
+):
+    """Re-optimizes `schedule` around the given change.
+
+    Args:
+      docs, desired_total_shifts, preferences, unavailable,
+      prefer_double_shifts, max_unfilled, num_days: the updated inputs, as
+        for solve.solve_shift_scheduling.
+      schedule: the current schedule, in the format that function returns.
+      changed_docs: names of the docs whose entries changed; they may be
+        moved on any day.
+      changed_days: the days whose entries changed; every doc may be moved
+        within `radius` days of them.
+      radius: the half-width of the day neighborhood.
+      change_cost: the objective cost of each assignment that moves.
+      policy: the stop policy, REPAIR_POLICY by default. Its max_time is
+        shared by all the rounds of the repair.
+      num_workers: the number of CP-SAT workers.
+      rules: the rules.Rules of the model, DEFAULT_RULES if None.
+      log_callback: receives CP-SAT's search log, see
+        solve.solve_shift_scheduling.
+
+    Returns:
+      a solve.Schedule. Its stats also carry `changed_shifts`, the number of
+      (day, shift) slots whose doc differs from `schedule`, and the
+      `repair_radius` used. If the neighborhood is too small for a feasible
+      repair it is doubled until it covers the whole horizon; once doubling
+      no longer grows it, the whole horizon is freed at once. The last
+      round's schedule is returned when the time runs out first.
+    """
+    changed_docs = set(changed_docs)
+    deadline = time.perf_counter() + policy.max_time
+    free_days = None
+    while True:
+        neighborhood = set()
+        for day in changed_days:
+            neighborhood.update(range(max(0, day - radius), min(num_days, day + radius + 1)))
+        if free_days is not None and len(neighborhood) <= len(free_days):
+            neighborhood = set(range(num_days))
+            radius = num_days
+        free_days = neighborhood
+        shift_model = solve.build_model(
+            docs, desired_total_shifts, preferences, unavailable,
+            prefer_double_shifts, max_unfilled, num_days, hint=schedule, rules=rules,
+        )
+        free_docs = [e for e, doc in enumerate(shift_model.docs) if doc in changed_docs]
+        fix_outside_neighborhood(shift_model, free_days, free_docs, change_cost)
+        repaired = solve.solve_model(
+            shift_model, policy.with_max_time(max(0.0, deadline - time.perf_counter())),
+            num_workers, log_callback=log_callback,
+        )
+        if repaired or len(free_days) >= num_days or time.perf_counter() >= deadline:
+            break
+        radius *= 2
+
+    repaired.stats["repair_radius"] = radius
+    if repaired:
+        repaired.stats["changed_shifts"] = sum(
+            1
+            for old, new in zip(schedule, repaired)
+            for old_doc, new_doc in zip(old, new)
+            if old_doc != new_doc
+        )
+    return repaired
+
+
+def fix_outside_neighborhood(shift_model, free_days, free_docs, change_cost):
+    """Constrains a hinted ShiftModel to a repair of its hint.
+
+    Slots outside `free_days` keep their hinted doc unless that doc is in
+    `free_docs`; the docs in `free_docs` are free everywhere. Every hinted
+    assignment left free costs `change_cost` if it is moved, so repaired
+    objectives are offset from those of a full solve.
+    """
+    model = shift_model.model
+    work = shift_model.work
+    free_docs = set(free_docs)
+    fixed_docs = [e for e in range(len(shift_model.docs)) if e not in free_docs]
+    for (s, d), e in shift_model.hinted.items():
+        if d not in free_days and e not in free_docs:
+            for other in fixed_docs:
+                model.Add(work[other][s][d] == (1 if other == e else 0))
+        else:
+            # Rewarding the kept assignment is a penalty on moving it, up to
+            # a constant offset of the objective.
+            shift_model.obj_bool_vars.append(work[e][s][d])
+            shift_model.obj_bool_coeffs.append(-change_cost)
+            shift_model.obj_bool_labels.append(("kept", e, s, d))
+    shift_model.minimize()
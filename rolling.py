@@ -0,0 +1,191 @@
+"""Rolling-horizon solving for long scheduling windows.
+
+The model grows with docs x shifts x days and the monthly sum constraints
+couple the whole horizon, so quarter- or year-long horizons are solved as
+a sequence of overlapping windows instead. Each window is solved on its
+own; its first `window` days are committed and the overlap is re-solved
+as the start of the next window. Some optimality is traded for solve
+time that grows about linearly with the horizon, so a horizon of more
+than one window is never reported OPTIMAL.
+"""
+
+import math
+
+import solve
+from rules import DEFAULT_RULES, NUM_SHIFTS, OFF, UNFILLED
+
+# Window sizes are whole weeks so that weekly rules stay aligned.
+WINDOW = 14
+OVERLAP = 7
+
+# Scoring the stitched schedule only propagates its fixed assignment.
+EVALUATION_POLICY = solve.StopPolicy(max_time=10.0)
+
+
+def solve_rolling(
+    docs,
+    desired_total_shifts,
+    preferences,
+    unavailable,
+    prefer_double_shifts,
+    max_unfilled,
+    num_days,
+    window=WINDOW,
+    overlap=OVERLAP,
+    policy=solve.DEFAULT_POLICY,
+    num_workers=None,
+    rules=None,
+):
+    """Solves a long horizon window by window.
+
+    Boundary state is carried from one window to the next: every
+    transition the rules forbid (NIGHT -> MORNING by default) is also
+    forbidden from the last committed day into the window, and each doc's
+    min/max totals (and max_unfilled) are what remains after the committed
+    days, spread over the remaining days in proportion to the window
+    length. Committed shifts are counted from the work variables, so a
+    shift covered by two docs counts for both.
+
+    Args:
+      docs, desired_total_shifts, preferences, unavailable,
+      prefer_double_shifts, max_unfilled, num_days: as for
+        solve.solve_shift_scheduling.
+      window: the number of days committed per window.
+      overlap: the number of extra days solved past each window, which
+        are re-solved (hinted) as part of the next window.
+      policy: the stop policy of each window solve.
+      num_workers: the number of CP-SAT workers.
+      rules: the rules.Rules of every window, DEFAULT_RULES if None.
+
+    Returns:
+      a solve.Schedule over the whole horizon, whose stats list the
+      `windows` solved and the `objective` of the stitched schedule on the
+      whole horizon's model (None if it breaks a hard constraint of that
+      model). Its status is FEASIBLE, or OPTIMAL when the horizon fits in
+      one window solved to optimality. As for solve.solve_shift_scheduling, its days name
+      one doc per shift, while a shift covered by more docs (excess cover)
+      shows in its work_values and totals. If a window has no solution,
+      the schedule is empty and carries that window's status.
+    """
+    if window % 7 or overlap % 7:
+        raise ValueError("window and overlap must be whole weeks")
+    if rules is None:
+        rules = DEFAULT_RULES
+    forbidden = [
+        (previous_shift, next_shift)
+        for previous_shift, next_shift, penalty in rules.penalized_transitions
+        if penalty == 0
+    ]
+    num_docs = len(docs)
+    worked = [0] * num_docs
+    unfilled = 0
+    # The work values of the whole horizon, laid out as in
+    # solve.ShiftModel.work_values, and the shifts of the last committed day.
+    values = bytearray((num_docs + 1) * NUM_SHIFTS * num_days)
+    last_day = None
+    schedule = []
+    carried = None
+    windows = []
+    status = "OPTIMAL"
+    start = 0
+    while start < num_days:
+        end = min(num_days, start + window + overlap)
+        commit = end if end == num_days else start + window
+        share = (end - start) / (num_days - start)
+
+        desired = {}
+        for e, doc in enumerate(docs):
+            low, high = desired_total_shifts[doc]
+            desired[doc] = (
+                math.floor(max(0, low - worked[e]) * share),
+                math.ceil(max(0, high - worked[e]) * share),
+            )
+        window_unfilled = math.ceil(max(0, max_unfilled - unfilled) * share)
+
+        shift_model = solve.build_model(
+            docs,
+            desired,
+            shift_days(preferences, start, end),
+            shift_days(unavailable, start, end),
+            prefer_double_shifts,
+            window_unfilled,
+            end - start,
+            hint=carried,
+            rules=rules,
+        )
+        if last_day is not None:
+            # Forbidden transitions across the window boundary.
+            work = shift_model.work
+            for e in range(num_docs):
+                for previous_shift, next_shift in forbidden:
+                    if last_day[e][previous_shift]:
+                        shift_model.model.Add(work[e][next_shift][0] == 0)
+
+        result = solve.solve_model(shift_model, policy, num_workers)
+        windows.append({
+            "start": start,
+            "end": end,
+            "status": result.status,
+            "objective": result.stats.get("objective"),
+            "solve_time": result.stats.get("solve_time"),
+        })
+        if not result:
+            return solve.Schedule([], result.status, {"windows": windows})
+        # Optimal windows do not make an optimal horizon.
+        if result.status != "OPTIMAL" or end < num_days:
+            status = "FEASIBLE"
+
+        length = end - start
+        committed = commit - start
+        for e in range(num_docs + 1):
+            for s in range(NUM_SHIFTS):
+                first = (e * NUM_SHIFTS + s) * length
+                days = result.work_values[first:first + committed]
+                target = (e * NUM_SHIFTS + s) * num_days + start
+                values[target:target + committed] = days
+                if s != OFF:
+                    if e < num_docs:
+                        worked[e] += days.count(1)
+                    else:
+                        unfilled += days.count(1)
+        last_day = [
+            [result.work_values[(e * NUM_SHIFTS + s) * length + committed - 1]
+             for s in range(NUM_SHIFTS)]
+            for e in range(num_docs)
+        ]
+        schedule.extend(result[:committed])
+        carried = result[committed:]
+        start = commit
+
+    values = bytes(values)
+    shift_model = solve.build_model(
+        docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+        max_unfilled, num_days, rules=rules,
+    )
+    scored = evaluate(shift_model, values, num_workers)
+    stats = {"windows": windows, "objective": scored.stats.get("objective")}
+    return solve.Schedule(
+        schedule, status, stats, list(docs) + [UNFILLED],
+        worked + [unfilled], scored.violations, values,
+    )
+
+
+def evaluate(shift_model, values, num_workers=None):
+    """Solves `shift_model` with every work variable fixed to `values`, as
+    laid out by solve.ShiftModel.work_values, which scores that schedule.
+    """
+    variables = shift_model.model.Proto().variables
+    first = shift_model.work[0][0][0].Index()
+    for i, value in enumerate(values):
+        domain = variables[first + i].domain
+        domain.clear()
+        domain.extend((value, value))
+    return solve.solve_model(shift_model, EVALUATION_POLICY, num_workers)
+
+
+def shift_days(entries, start, end):
+    """Returns doc -> [(day, shift)] restricted to [start, end), rebased to start."""
+    return {
+        doc: [(day - start, shift) for day, shift in days if start <= day < end]
+        for doc, days in entries.items()
+    }
@@ -0,0 +1,118 @@
+"""Validation of the doc list posted by dynamic.js.
+
+parse_roster checks the docs in a single pass into a Roster, whose
+inputs() are the dicts that solve.build_model and the other solver
+modules take. The Roster is only the validated form of the request: the
+service parses each request once (see service.parse_request) and the
+solvers work on its inputs.
+"""
+
+from typing import NamedTuple
+
+from rules import MORNING, NIGHT, UNFILLED
+
+
+class Roster(NamedTuple):
+    """A validated doc list.
+
+    Attributes:
+      docs: the doc names, in request order.
+      bounds: the (min, max) total shifts of each doc.
+      preferred: the preferred days of each doc, as a bitmask.
+      unavailable: the unavailable days of each doc, as a bitmask.
+      prefer_double: whether each doc may work both shifts of a day.
+    """
+
+    docs: tuple
+    bounds: tuple
+    preferred: tuple
+    unavailable: tuple
+    prefer_double: tuple
+
+    def inputs(self):
+        """Returns the (docs, desired, preferences, unavailable,
+        prefer_double) inputs of solve.build_model, as fresh containers.
+
+        Preferences and unavailability cover both shifts of their days.
+        """
+        docs = list(self.docs)
+        return (
+            docs,
+            dict(zip(docs, self.bounds)),
+            {doc: both_shifts(mask) for doc, mask in zip(docs, self.preferred)},
+            {doc: both_shifts(mask) for doc, mask in zip(docs, self.unavailable)},
+            dict(zip(docs, self.prefer_double)),
+        )
+
+
+def mask_days(mask):
+    """Returns the days set in a day bitmask, in increasing order."""
+    return [day for day, bit in enumerate(reversed(bin(mask))) if bit == "1"]
+
+
+def both_shifts(mask):
+    # todo: support shift prefs
+    return [(day, shift) for day in mask_days(mask) for shift in (MORNING, NIGHT)]
+
+
+def parse_roster(doc_list, num_days=None):
+    """Returns the Roster of a decoded doc list.
+
+    Each doc is `{"name", "min", "max", "preferred", "unavailable"}` with an
+    optional `"prefer_double"` flag, false by default.
+
+    Args:
+      doc_list: the decoded JSON list.
+      num_days: the horizon; days outside it are rejected. If None, days
+        only need to be non-negative.
+
+    Raises:
+      ValueError: for a malformed doc, a duplicate or reserved name, or a
+        day out of range. A missing field raises KeyError.
+    """
+    if not isinstance(doc_list, list):
+        raise ValueError("the docs must be a list")
+    docs = []
+    names = set()
+    bounds = []
+    preferred = []
+    unavailable = []
+    prefer_double = []
+    for doc in doc_list:
+        if not isinstance(doc, dict):
+            raise ValueError("each doc must be an object")
+        name = doc["name"]
+        if not isinstance(name, str) or not name:
+            raise ValueError("doc names must be non-empty strings")
+        if name in names or name == UNFILLED:
+            raise ValueError("duplicate or reserved doc name %r" % name)
+        names.add(name)
+        docs.append(name)
+        bounds.append((count(doc, "min"), count(doc, "max")))
+        preferred.append(day_mask(doc, "preferred", num_days))
+        unavailable.append(day_mask(doc, "unavailable", num_days))
+        double = doc.get("prefer_double", False)
+        if not isinstance(double, bool):
+            raise ValueError("%s's prefer_double must be true or false" % name)
+        prefer_double.append(double)
+    return Roster(
+        tuple(docs), tuple(bounds),
+        tuple(preferred), tuple(unavailable), tuple(prefer_double),
+    )
+
+
+def count(doc, field):
+    value = doc[field]
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError("%s's %s must be a non-negative integer" % (doc["name"], field))
+    return value
+
+
+def day_mask(doc, field, num_days):
+    mask = 0
+    for day in doc[field]:
+        if isinstance(day, bool) or not isinstance(day, int) or day < 0 or (
+                num_days is not None and day >= num_days):
+            raise ValueError("%s has %s day %r outside the month" % (doc["name"], field, day))
+        mask |= 1 << day
+    return mask
@@ -0,0 +1,209 @@
+"""The rule tables of the scheduling model, as a validated configuration.
+
+Rules are plain immutable data: they can be built from the JSON sent with
+a request, compared and hashed, so that requests sharing a ruleset share
+its compiled form (see compile_rules).
+"""
+
+import functools
+from typing import NamedTuple
+
+# Shift codes.
+OFF = 0
+MORNING = 1
+NIGHT = 2
+NUM_SHIFTS = 3
+
+# The pseudo-doc that takes the shifts no doc covers.
+UNFILLED = "Unfilled"
+
+SEQUENCE_ENCODINGS = ("clauses", "counter")
+
+
+class SequenceRule(NamedTuple):
+    """A constraint on runs of consecutive days on `shift`.
+
+    Runs shorter than hard_min or longer than hard_max are forbidden;
+    runs shorter than soft_min or longer than soft_max pay min_penalty or
+    max_penalty per missing or excess day. `encoding` is "clauses" (one
+    clause per span) or "counter" (run-length counters, linear in the
+    horizon).
+    """
+
+    shift: int
+    hard_min: int
+    soft_min: int
+    min_penalty: int
+    soft_max: int
+    hard_max: int
+    max_penalty: int
+    encoding: str = "clauses"
+
+
+class SumRule(NamedTuple):
+    """A constraint on the number of days on `shift` in each week."""
+
+    shift: int
+    hard_min: int
+    soft_min: int
+    min_penalty: int
+    soft_max: int
+    hard_max: int
+    max_penalty: int
+
+
+class Transition(NamedTuple):
+    """A penalized shift on one day followed by another the next day.
+
+    A penalty of 0 forbids the transition.
+    """
+
+    previous_shift: int
+    next_shift: int
+    penalty: int
+
+
+class Rules(NamedTuple):
+    """The rule families of a scheduling model.
+
+    Attributes:
+      shift_constraints: SequenceRules applied to every doc.
+      weekly_sum_constraints: SumRules applied to every doc and week.
+      penalized_transitions: Transitions applied to every doc.
+      weekly_cover_demands: (morning, night) demands for each day of the
+        week, starting on Monday.
+      excess_cover_penalties: the penalty for each doc beyond the demand,
+        indexed by shift - 1.
+    """
+
+    shift_constraints: tuple = (
+        # One or two consecutive days of rest, this is a hard constraint.
+        #SequenceRule(OFF, 1, 1, 0, 2, 2, 0),
+        # between 2 and 3 consecutive days of night shifts, 1 and 4 are
+        # possible but penalized.
+        #SequenceRule(NIGHT, 1, 2, 20, 3, 4, 5),
+    )
+    weekly_sum_constraints: tuple = (
+        # Constraints on rests per week.
+        #SumRule(OFF, 1, 2, 7, 2, 3, 4),
+        # At least 1 night shift per week (penalized). At most 4 (hard).
+        #SumRule(NIGHT, 0, 1, 3, 4, 4, 0),
+    )
+    penalized_transitions: tuple = (
+        # Night to morning is forbidden.
+        Transition(NIGHT, MORNING, 0),
+    )
+    weekly_cover_demands: tuple = (
+        (1, 1),  # Monday
+        (1, 1),  # Tuesday
+        (1, 1),  # Wednesday
+        (1, 1),  # Thursday
+        (1, 1),  # Friday
+        (1, 1),  # Saturday
+        (1, 1),  # Sunday
+    )
+    excess_cover_penalties: tuple = (2, 2, 5)
+
+    def validate(self):
+        """Raises ValueError if any rule is out of range."""
+        for rule in self.shift_constraints:
+            check_shift(rule.shift)
+            if not 1 <= rule.hard_min <= rule.soft_min <= rule.soft_max <= rule.hard_max:
+                raise ValueError("sequence bounds out of order in %r" % (rule,))
+            check_penalties(rule, rule.min_penalty, rule.max_penalty)
+            if rule.encoding not in SEQUENCE_ENCODINGS:
+                raise ValueError("unknown sequence encoding %r" % rule.encoding)
+        for rule in self.weekly_sum_constraints:
+            check_shift(rule.shift)
+            if not 0 <= rule.hard_min <= rule.soft_min <= rule.soft_max <= rule.hard_max <= 7:
+                raise ValueError("weekly sum bounds out of order in %r" % (rule,))
+            check_penalties(rule, rule.min_penalty, rule.max_penalty)
+        for rule in self.penalized_transitions:
+            check_shift(rule.previous_shift)
+            check_shift(rule.next_shift)
+            check_penalties(rule, rule.penalty)
+        if len(self.weekly_cover_demands) != 7:
+            raise ValueError("weekly_cover_demands needs one entry per day of the week")
+        for demand in self.weekly_cover_demands:
+            if len(demand) != NUM_SHIFTS - 1 or min(demand) < 0:
+                raise ValueError("bad cover demand %r" % (demand,))
+        if len(self.excess_cover_penalties) != NUM_SHIFTS:
+            raise ValueError("excess_cover_penalties needs one entry per shift")
+        check_penalties(self.excess_cover_penalties, *self.excess_cover_penalties)
+        return self
+
+
+DEFAULT_RULES = Rules()
+
+
+def check_shift(shift):
+    if shift not in range(NUM_SHIFTS):
+        raise ValueError("unknown shift %r" % (shift,))
+
+
+def check_penalties(rule, *penalties):
+    if min(penalties) < 0:
+        raise ValueError("negative penalty in %r" % (rule,))
+
+
+def rules_from_json(config):
+    """Returns validated Rules from a decoded JSON object.
+
+    Missing families keep their DEFAULT_RULES value. Rule entries may be
+    lists in field order or objects keyed by field name.
+    """
+    if config is None:
+        return DEFAULT_RULES
+    if not isinstance(config, dict):
+        raise ValueError("rules must be an object")
+    unknown = set(config) - set(Rules._fields)
+    if unknown:
+        raise ValueError("unknown rule families: %s" % ", ".join(sorted(unknown)))
+
+    def entries(name, kind):
+        return tuple(
+            kind(**entry) if isinstance(entry, dict) else kind(*entry)
+            for entry in config[name]
+        )
+
+    families = {}
+    if "shift_constraints" in config:
+        families["shift_constraints"] = entries("shift_constraints", SequenceRule)
+    if "weekly_sum_constraints" in config:
+        families["weekly_sum_constraints"] = entries("weekly_sum_constraints", SumRule)
+    if "penalized_transitions" in config:
+        families["penalized_transitions"] = entries("penalized_transitions", Transition)
+    if "weekly_cover_demands" in config:
+        families["weekly_cover_demands"] = tuple(tuple(d) for d in config["weekly_cover_demands"])
+    if "excess_cover_penalties" in config:
+        families["excess_cover_penalties"] = tuple(config["excess_cover_penalties"])
+    return DEFAULT_RULES._replace(**families).validate()
+
+
+class CompiledRules(NamedTuple):
+    """The parts of a ruleset that only depend on the horizon.
+
+    Attributes:
+      day_demands: the (morning, night) demand of each day.
+      weeks: the (start, end) day range of each week.
+      cover_penalties: the excess penalty of each shift with a positive
+        one, as (shift, penalty).
+    """
+
+    day_demands: tuple
+    weeks: tuple
+    cover_penalties: tuple
+
+
+@functools.lru_cache(maxsize=64)
+def compile_rules(rules, num_days):
+    """Expands `rules` over a horizon; cached per (rules, num_days)."""
+    return CompiledRules(
+        day_demands=tuple(rules.weekly_cover_demands[d % 7] for d in range(num_days)),
+        weeks=tuple((w, min(w + 7, num_days)) for w in range(0, num_days, 7)),
+        cover_penalties=tuple(
+            (s, rules.excess_cover_penalties[s - 1])
+            for s in range(1, NUM_SHIFTS)
+            if rules.excess_cover_penalties[s - 1] > 0
+        ),
+    )
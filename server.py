@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Long-lived solver service.
+
+Serves the same `POST ?days=N[&stream=1]` contract as cgi-bin/solve-cgi.py, but
+keeps the interpreter and OR-Tools loaded between requests and runs solves
+through a job queue bounded by a CPU budget, see jobs.py. Static files
+(index.html, dynamic.js, ...) are served from this directory so the UI
+works unchanged. POST /batch takes a list of requests, see batch.py,
+each queued as a job of its own.
+
+Jobs can also be driven directly: POST /jobs?days=N queues a request and
+returns its id and subscription token, GET /jobs/<id> reports its status
+and best schedule so far, DELETE /jobs/<id>?subscription=<token> lets go
+of it, which cancels it unless other requests share it, and GET /jobs
+reports the queue depth and expected wait.
+
+    python3 server.py --port 8000
+"""
+
+import argparse
+import functools
+import http.server
+import json
+import os
+import queue
+import sys
+import urllib.parse
+
+import batch
+import cache
+import jobs
+import service
+import templates
+
+SOLVE_PATHS = ("/cgi-bin/solve-cgi.py", "/solve")
+BATCH_PATH = "/batch"
+JOBS_PATH = "/jobs"
+
+
+class SolverHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves static files and hands solve requests to the job queue."""
+
+    jobs = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == JOBS_PATH:
+            self.send_json(200, self.jobs.summary())
+            return
+        if url.path.startswith(JOBS_PATH + "/"):
+            job = self.jobs.get(url.path[len(JOBS_PATH) + 1:])
+            if job is None:
+                self.send_error(404)
+                return
+            self.send_json(200, self.jobs.report(job))
+            return
+        super().do_GET()
+
+    def do_DELETE(self):
+        url = urllib.parse.urlsplit(self.path)
+        job = None
+        if url.path.startswith(JOBS_PATH + "/"):
+            job = self.jobs.get(url.path[len(JOBS_PATH) + 1:])
+        if job is None:
+            self.send_error(404)
+            return
+        subscription = urllib.parse.parse_qs(url.query).get("subscription", [""])[0]
+        if not self.jobs.release(job, subscription):
+            self.send_json(403, {"error": "not a subscription of job %s" % job.id})
+            return
+        self.send_json(200, self.jobs.report(job))
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path not in SOLVE_PATHS and url.path not in (BATCH_PATH, JOBS_PATH):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        if url.path == BATCH_PATH:
+            self.batch_solve(body)
+            return
+        try:
+            job, subscription = self.jobs.submit(body, url.query)
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {"error": "bad request: %s" % e})
+            return
+        if url.path == JOBS_PATH:
+            self.send_json(202, dict(self.jobs.report(job), subscription=subscription))
+            return
+        if service.wants_stream(url.query):
+            self.stream_solve(job, subscription)
+            return
+        event = job.final_event()
+        if "error" in event:
+            self.send_json(400 if event["error"].startswith("bad request") else 500, event)
+            return
+        self.send_json(200, event["schedule"], {
+            "X-Solve-Status": event["status"],
+            "X-Solve-Stats": json.dumps(header_stats(event["stats"]), sort_keys=True),
+        })
+
+    def stream_solve(self, job, subscription):
+        """Writes each improving schedule of `job` as a JSON line.
+
+        The first line names the job and the request's subscription, so the
+        client can let go of it with DELETE /jobs/<id>?subscription=<token>,
+        and reports its place in the queue. The response has no length and
+        ends when the connection closes. Empty lines are sent while waiting,
+        and if the client goes away its subscription lets go of the job,
+        which cancels it unless another request shares it.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            self.write_event({
+                "job": job.id, "subscription": subscription, "queue": self.jobs.report(job),
+            })
+            index = 0
+            while True:
+                event = job.next_event(index, timeout=1.0)
+                if event is None:
+                    # An empty line keeps probing whether the client is gone.
+                    self.wfile.write(b"\n")
+                    self.wfile.flush()
+                    continue
+                index += 1
+                self.write_event(event)
+                if event.get("done"):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            self.jobs.release(job, subscription)
+
+    def write_event(self, event):
+        self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def batch_solve(self, body):
+        """Queues each item of a batch as a job, writing a JSON line per item
+        as it finishes.
+
+        Items share the queue's CPU budget, deduplication and max_queued
+        limit with every other request. If the client goes away, the batch
+        lets go of its jobs.
+        """
+        try:
+            items = json.loads(body)
+            if not isinstance(items, list):
+                raise ValueError("a batch must be a list of items")
+        except ValueError as e:
+            self.send_json(400, {"error": "bad request: %s" % e})
+            return
+        results = queue.Queue()
+        subscriptions = []
+        for item in items:
+            item_id = batch.item_id_of(item)
+            try:
+                job, subscription = self.jobs.submit_payload(*batch.parse_item(item))
+            except (KeyError, ValueError, TypeError) as e:
+                results.put({"id": item_id, "error": "bad request: %s" % e})
+                continue
+            subscriptions.append((job, subscription))
+            job.add_done_callback(
+                lambda event, item_id=item_id: results.put(batch.event_result(item_id, event))
+            )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for i in range(len(items)):
+                self.wfile.write(json.dumps(results.get()).encode("utf-8") + b"\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            for job, subscription in subscriptions:
+                self.jobs.release(job, subscription)
+
+    def send_json(self, code, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def header_stats(stats):
+    """Returns the stats sent in the X-Solve-Stats header, without the
+    alternative schedules of a pareto solve: they are too large for a
+    header, and streamed and /jobs responses carry them.
+    """
+    return {name: value for name, value in stats.items() if name != "alternatives"}
+
+
+def make_server(host, port, cpu_budget=None, threads_per_solve=jobs.THREADS_PER_SOLVE,
+                cache_size=128, cache_dir=None, template_dir=None, max_queued=None):
+    """Creates the HTTP server, solving within `cpu_budget` cores."""
+    service.CACHE = cache.ScheduleCache(cache_size, cache_dir)
+    service.TEMPLATES = templates.TemplateCache(directory=template_dir)
+    SolverHandler.jobs = jobs.JobQueue(cpu_budget, threads_per_solve, max_queued)
+    root = os.path.dirname(os.path.abspath(__file__))
+    handler = functools.partial(SolverHandler, directory=root)
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cpu-budget", type=int, default=None,
+                        help="cores shared by the running solves (default: all)")
+    parser.add_argument("--threads-per-solve", type=int, default=jobs.THREADS_PER_SOLVE,
+                        help="CP-SAT workers of each solve")
+    parser.add_argument("--max-queued", type=int, default=None,
+                        help="queued solves beyond which requests get a greedy schedule")
+    parser.add_argument("--cache-size", type=int, default=128,
+                        help="number of schedules kept in memory")
+    parser.add_argument("--cache-dir", default=os.environ.get("SCHEDULER_CACHE_DIR"),
+                        help="directory backing the schedule cache on disk")
+    parser.add_argument("--template-dir", default=os.environ.get("SCHEDULER_TEMPLATE_DIR"),
+                        help="directory backing the model template cache on disk")
+    args = parser.parse_args()
+    server = make_server(
+        args.host, args.port, args.cpu_budget, args.threads_per_solve, args.cache_size,
+        args.cache_dir, args.template_dir, args.max_queued,
+    )
+    sys.stderr.write("Serving on http://%s:%i/\n" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
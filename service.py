@@ -0,0 +1,395 @@
+"""Request handling shared by the CGI script and the solver service."""
+
+import json
+import os
+import sys
+import time
+import urllib.parse
+from typing import NamedTuple
+
+import cache
+import diagnose
+import heuristic
+import pareto
+import profiling
+import repair
+import roster
+import solve
+import templates
+from rules import rules_from_json
+
+# The CGI script only benefits from the on-disk store, which is enabled by
+# setting SCHEDULER_CACHE_DIR; the service may replace this at startup.
+CACHE = cache.ScheduleCache(directory=os.environ.get("SCHEDULER_CACHE_DIR"))
+
+# Built models by request shape, on disk if SCHEDULER_TEMPLATE_DIR is set.
+TEMPLATES = templates.TemplateCache(directory=os.environ.get("SCHEDULER_TEMPLATE_DIR"))
+
+# Values of the "objective" option: the weighted sum of penalties, or a
+# multi-objective mode of pareto.py.
+OBJECTIVES = ("weighted", "lexicographic", "pareto")
+
+
+def parse_days(query):
+    """Returns the `days` parameter of a `?days=N` query string."""
+    pairs = urllib.parse.parse_qs(query)
+    return int(pairs["days"][0])
+
+
+def parse_body(body):
+    """Splits a request body into the doc list and the request options.
+
+    The body is either the bare doc list, or an object holding it under
+    "docs" next to options such as "hint", "policy" (a solve.POLICIES
+    name), "rules" (see rules.rules_from_json), "objective" (see
+    solve_objective) and "repair". A repair request is
+    `{"schedule": [...], "docs": [names], "days": [days]}`: the current
+    schedule and the docs and days whose entries changed since.
+    """
+    payload = json.loads(body)
+    if isinstance(payload, dict):
+        options = dict(payload)
+        return options.pop("docs"), options
+    return payload, {}
+
+
+def wants_stream(query):
+    """Returns whether a query string asks for streamed solutions."""
+    pairs = urllib.parse.parse_qs(query)
+    return pairs.get("stream", ["0"])[0] not in ("", "0")
+
+
+def solve_request(body, query, listener=None, cancel=None):
+    """Solves one schedule request.
+
+    Args:
+      body: the JSON request posted by dynamic.js, see parse_body.
+      query: the raw query string, which must carry `days=N`.
+      listener: called with (objective, schedule) for each improving
+        solution; a cache hit calls nothing.
+      cancel: a threading.Event that stops the solve when set.
+
+    Returns:
+      the solve.Schedule for the request, see solve_payload.
+    """
+    num_days = parse_days(query)
+    doc_list, options = parse_body(body)
+    return solve_payload(doc_list, num_days, options, listener, cancel)
+
+
+class Request(NamedTuple):
+    """A decoded request, validated once; see parse_request.
+
+    Attributes:
+      doc_list, num_days, options: the request as decoded.
+      inputs: the solve.build_model inputs of its docs.
+      rules: its rules.Rules.
+      hint: its validated "hint" option, or None.
+      repair: its validated "repair" option, or None.
+      parse_time: the seconds spent parsing and validating it.
+    """
+
+    doc_list: list
+    num_days: int
+    options: dict
+    inputs: tuple
+    rules: tuple
+    hint: list
+    repair: dict
+    parse_time: float
+
+
+def parse_request(doc_list, num_days, options):
+    """Validates a decoded request and returns it as a Request.
+
+    Raises:
+      ValueError: for invalid docs (see roster.parse_roster), rules or
+        options; a missing field raises KeyError.
+    """
+    start = time.perf_counter()
+    inputs = roster.parse_roster(doc_list, num_days).inputs()
+    rules = rules_from_json(options.get("rules"))
+    request_policy(options)
+    request_objective(options)
+    request_points(options)
+    num_docs = len(inputs[0])
+    hint = request_hint(options, num_docs)
+    repair_options = request_repair(options, num_docs, num_days)
+    return Request(
+        doc_list, num_days, options, inputs, rules, hint, repair_options,
+        time.perf_counter() - start,
+    )
+
+
+def request_key(request):
+    """Returns the cache key of a Request, or None for a repair, a
+    multi-objective or a profiled solve.
+    """
+    options = request.options
+    if (request.repair or request_objective(options) != "weighted"
+            or profiling.requested(options)):
+        return None
+    return cache.cache_key(
+        *request.inputs, solve.MAX_UNFILLED, request.num_days, request_policy(options),
+        request.rules,
+    )
+
+
+def request_policy(options):
+    policy = options.get("policy") or solve.DEFAULT_POLICY
+    if policy not in solve.POLICIES:
+        raise ValueError("unknown policy %r" % policy)
+    return policy
+
+
+def request_hint(options, num_docs):
+    """Returns the validated "hint" option, or None without one."""
+    hint = options.get("hint")
+    if not hint:
+        return None
+    check_schedule(hint, num_docs, "hint")
+    return hint
+
+
+def check_schedule(schedule, num_docs, what):
+    """Raises ValueError unless `schedule` is a `[[morning_doc, night_doc],
+    ...]` list of doc indices below `num_docs` or nulls.
+    """
+    if not isinstance(schedule, list):
+        raise ValueError("the %s must be a list of days" % what)
+    for day in schedule:
+        if not isinstance(day, list) or len(day) != 2:
+            raise ValueError("each day of the %s must be [morning_doc, night_doc]" % what)
+        for e in day:
+            if e is not None and (isinstance(e, bool) or not isinstance(e, int)
+                                  or not 0 <= e < num_docs):
+                raise ValueError("the %s names unknown doc %r" % (what, e))
+
+
+def request_repair(options, num_docs, num_days):
+    """Returns the validated "repair" option, or None without one.
+
+    Raises ValueError unless it is `{"schedule", "docs", "days"}` with a
+    valid schedule (see check_schedule) and at least one changed day, all
+    within the horizon.
+    """
+    repair_options = options.get("repair")
+    if not repair_options:
+        return None
+    if not isinstance(repair_options, dict):
+        raise ValueError("repair must be an object")
+    check_schedule(repair_options["schedule"], num_docs, "repaired schedule")
+    changed_docs, changed_days = repair_options["docs"], repair_options["days"]
+    if not isinstance(changed_docs, list) or not all(isinstance(doc, str) for doc in changed_docs):
+        raise ValueError("the changed docs must be a list of names")
+    if not isinstance(changed_days, list) or not changed_days:
+        raise ValueError("a repair needs the changed days")
+    for day in changed_days:
+        if isinstance(day, bool) or not isinstance(day, int) or not 0 <= day < num_days:
+            raise ValueError("changed day %r outside the month" % (day,))
+    return repair_options
+
+
+def request_points(options):
+    """Returns the "points" option of a pareto request, 3 by default."""
+    points = options.get("points", 3)
+    if isinstance(points, bool) or not isinstance(points, int) or points < 1:
+        raise ValueError("points must be a positive integer")
+    return points
+
+
+def request_objective(options):
+    objective = options.get("objective") or "weighted"
+    if objective not in OBJECTIVES:
+        raise ValueError("unknown objective %r" % objective)
+    return objective
+
+
+def solve_payload(
+    doc_list, num_days, options, listener=None, cancel=None, num_workers=None, preview=True,
+):
+    """Solves an already decoded request; see solve_request.
+
+    `num_workers` is the number of CP-SAT workers, one per core by default.
+    Before solving, a greedy schedule (see heuristic.py) is passed to
+    `listener` as a preview with no objective, unless `preview` is false,
+    and hints the solve when the request has no hint.
+
+    Returns:
+      the solve.Schedule for the request, from CACHE when the same inputs
+      were solved before. Its stats also carry parse_time and whether it
+      was `cached`, and are logged to stderr. A request rejected by the
+      precheck is answered with an empty INFEASIBLE schedule whose stats
+      explain why in "diagnosis" (see diagnose.Conflict). When a solve finds
+      no schedule, its status and stats come with the greedy schedule
+      instead, and stats["fallback"] is set. Days that every doc asked to
+      have off are listed in "warnings". A profiled request (see
+      profiling.py) bypasses the cache and names its bundle in
+      stats["profile"].
+    """
+    request = parse_request(doc_list, num_days, options)
+    return solve_parsed(request, listener, cancel, num_workers, preview)
+
+
+def solve_parsed(request, listener=None, cancel=None, num_workers=None, preview=True):
+    """Solves a Request, parsed by the caller; see solve_payload."""
+    if not profiling.requested(request.options):
+        return solve_decoded(request, listener, cancel, num_workers, preview)
+    recorder = profiling.Recorder(request.doc_list, request.num_days, request.options)
+    recorder.start()
+    try:
+        schedule = solve_decoded(request, listener, cancel, num_workers, preview, recorder.log)
+    finally:
+        recorder.stop()
+    recorder.finish(schedule)
+    return schedule
+
+
+def solve_decoded(request, listener, cancel, num_workers, preview, log_callback=None):
+    """Solves a Request for solve_parsed, passing CP-SAT's search log to
+    `log_callback`; profiled requests are not cached.
+    """
+    inputs, num_days, options = request.inputs, request.num_days, request.options
+    docs, desired, preferred, unavailable, prefer_double = inputs
+    rules, hint, repair_options = request.rules, request.hint, request.repair
+    conflicts, warnings = diagnose.precheck(*inputs, solve.MAX_UNFILLED, num_days, rules)
+    if conflicts:
+        schedule = solve.Schedule(status="INFEASIBLE", stats={"diagnosis": diagnose.as_json(conflicts)})
+    elif repair_options:
+        schedule = repair.repair_schedule(
+            *inputs, solve.MAX_UNFILLED, num_days,
+            repair_options["schedule"], repair_options["docs"], repair_options["days"],
+            num_workers=num_workers,
+            rules=rules,
+            log_callback=log_callback,
+        )
+        diagnose_infeasible(schedule, inputs, num_days, rules)
+    elif request_objective(options) != "weighted":
+        greedy = greedy_preview(inputs, num_days, rules, listener if preview else None)
+        options = dict(options, hint=hint or greedy)
+        schedule = solve_objective(
+            inputs, num_days, options, listener, cancel, num_workers, rules, log_callback
+        )
+        diagnose_infeasible(schedule, inputs, num_days, rules)
+        schedule = with_fallback(schedule, greedy)
+    else:
+        policy = request_policy(options)
+        key = cache.cache_key(*inputs, solve.MAX_UNFILLED, num_days, policy, rules)
+        profiled = log_callback is not None
+        schedule = CACHE.get(key) if not profiled else None
+        cached = schedule is not None
+        greedy = None
+        if not cached:
+            greedy = greedy_preview(inputs, num_days, rules, listener if preview else None)
+            schedule = solve.solve_shift_scheduling(
+                docs, desired, preferred, unavailable, prefer_double, solve.MAX_UNFILLED, num_days,
+                hint=hint or greedy,
+                policy=policy,
+                num_workers=num_workers,
+                listener=listener,
+                cancel=cancel,
+                rules=rules,
+                templates=TEMPLATES,
+                log_callback=log_callback,
+            )
+            diagnose_infeasible(schedule, inputs, num_days, rules)
+            # A cancelled search stopped early; its schedule is no answer.
+            if not profiled and (cancel is None or not cancel.is_set()):
+                CACHE.put(key, schedule)
+        if not schedule:
+            schedule = with_fallback(
+                schedule, greedy or heuristic.greedy_schedule(*inputs, solve.MAX_UNFILLED, num_days, rules)
+            )
+        schedule.stats["cached"] = cached
+    schedule.stats["parse_time"] = request.parse_time
+    if warnings:
+        schedule.stats["warnings"] = diagnose.as_json(warnings)
+    sys.stderr.write("Stats: %s\n" % json.dumps(schedule.stats, sort_keys=True))
+    return schedule
+
+
+def solve_objective(inputs, num_days, options, listener, cancel, num_workers, rules, log_callback=None):
+    """Solves a request with a multi-objective "objective" option.
+
+    "lexicographic" minimizes unfilled shifts first, see
+    pareto.solve_lexicographic. "pareto" returns the schedule with the best
+    objective, and in stats["alternatives"] up to `"points"` - 1 others
+    with fewer unfilled shifts, as {"schedule", "unfilled", "objective"};
+    see pareto.solve_pareto. Neither is cached.
+    """
+    policy = request_policy(options)
+    if request_objective(options) == "lexicographic":
+        return pareto.solve_lexicographic(
+            *inputs, solve.MAX_UNFILLED, num_days, options.get("hint"), policy, num_workers,
+            listener, cancel, rules, log_callback,
+        )
+    front = pareto.solve_pareto(
+        *inputs, solve.MAX_UNFILLED, num_days, request_points(options),
+        options.get("hint"), policy, num_workers, cancel, rules, log_callback,
+    )
+    schedule = front[0]
+    schedule.stats["alternatives"] = [
+        {"schedule": other, "unfilled": other.stats["unfilled"], "objective": other.stats["objective"]}
+        for other in front[1:]
+    ]
+    return schedule
+
+
+def greedy_preview(inputs, num_days, rules, listener=None):
+    """Returns the greedy schedule of a request, passing it to `listener`
+    as a preview.
+    """
+    greedy = heuristic.greedy_schedule(*inputs, solve.MAX_UNFILLED, num_days, rules)
+    if listener is not None:
+        listener(None, greedy)
+    return greedy
+
+
+def with_fallback(schedule, greedy):
+    """Returns `schedule`, or if it is empty `greedy` with its status and
+    stats; stats["fallback"] then holds the greedy schedule's stats.
+    """
+    if schedule:
+        return schedule
+    stats = dict(schedule.stats, fallback=greedy.stats)
+    return solve.Schedule(greedy, schedule.status, stats, greedy.docs, greedy.totals)
+
+
+def preview_payload(request):
+    """Returns the greedy schedule of a Request, or None for a repair, which
+    already shows its schedule.
+    """
+    if request.repair:
+        return None
+    return heuristic.greedy_schedule(
+        *request.inputs, solve.MAX_UNFILLED, request.num_days, request.rules
+    )
+
+
+def diagnose_infeasible(schedule, inputs, num_days, rules):
+    """Adds the unsat core of an INFEASIBLE solve to its stats.
+
+    A MODEL_INVALID solve is diagnosed too: a demand no roster can meet
+    leaves a cover variable with an empty domain.
+    """
+    if schedule.status not in ("INFEASIBLE", "MODEL_INVALID"):
+        return
+    docs, desired, preferred, unavailable, prefer_double = inputs
+    conflicts = diagnose.unsat_core(docs, desired, prefer_double, solve.MAX_UNFILLED, num_days, rules)
+    schedule.stats["diagnosis"] = diagnose.as_json(conflicts)
+
+
+def progress_event(objective, schedule):
+    """Returns the stream event for an improving solution.
+
+    A schedule without an objective is a greedy preview, and is marked so.
+    """
+    event = {"objective": objective, "schedule": schedule}
+    if objective is None:
+        event["preview"] = True
+    return event
+
+
+def final_event(schedule):
+    """Returns the last stream event, carrying the final schedule."""
+    return {"status": schedule.status, "schedule": schedule, "stats": schedule.stats, "done": True}
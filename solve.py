@@ -18,11 +18,19 @@
 #from absl import flags
 
 #from google.protobuf import text_format
+from ortools.sat import sat_parameters_pb2
 from ortools.sat.python import cp_model
+import itertools
 import json
 import sys
 import math
+import os
+import threading
 import time
+from typing import NamedTuple
+
+import roster
+from rules import OFF, MORNING, NIGHT, UNFILLED, DEFAULT_RULES, compile_rules
 
 #_OUTPUT_PROTO = flags.DEFINE_string(
 #    "output_proto", "", "Output file to write the cp_model proto to."
@@ -32,26 +40,267 @@ import time
 #)
 
 
+class StopPolicy:
+    """Decides when a solve may stop before CP-SAT proves optimality.
+
+    Args:
+      max_time: ceiling on the solve time, in seconds.
+      stall_time: stop once the objective has not improved for this many
+        seconds; None never stops on a stall.
+      relative_gap: stop once |objective - bound| / |objective| is at most
+        this value; 0 waits for a proof of optimality.
+      base_time: when set, the time limit is base_time plus
+        time_per_variable seconds for each model variable, capped at max_time.
+      time_per_variable: see base_time.
+    """
+
+    def __init__(
+        self,
+        max_time=10.0,
+        stall_time=None,
+        relative_gap=0.0,
+        base_time=None,
+        time_per_variable=0.0,
+    ):
+        self.max_time = max_time
+        self.stall_time = stall_time
+        self.relative_gap = relative_gap
+        self.base_time = base_time
+        self.time_per_variable = time_per_variable
+
+    def with_max_time(self, max_time):
+        """Returns a copy of this policy whose time ceiling is at most max_time."""
+        return StopPolicy(
+            min(self.max_time, max_time),
+            self.stall_time,
+            self.relative_gap,
+            self.base_time,
+            self.time_per_variable,
+        )
+
+    def time_limit(self, num_variables):
+        """Returns the solve time limit for a model of the given size."""
+        if self.base_time is None:
+            return self.max_time
+        return min(self.max_time, self.base_time + self.time_per_variable * num_variables)
+
+
+# Stop policies selectable by name for each request.
+POLICIES = {
+    # The historical behaviour: run until optimal or 10 seconds.
+    "fixed": StopPolicy(max_time=10.0),
+    # Interactive use: settle for a 5% gap or one second without progress.
+    "fast": StopPolicy(
+        max_time=5.0, stall_time=1.0, relative_gap=0.05, base_time=0.5, time_per_variable=0.0005
+    ),
+    "balanced": StopPolicy(
+        max_time=30.0, stall_time=3.0, relative_gap=0.01, base_time=1.0, time_per_variable=0.001
+    ),
+    # Large rosters that need a good answer more than a quick one.
+    "thorough": StopPolicy(
+        max_time=120.0, stall_time=15.0, base_time=5.0, time_per_variable=0.005
+    ),
+}
+DEFAULT_POLICY = "balanced"
+
+
 class SolutionPrinter(cp_model.CpSolverSolutionCallback):
-    """Display the objective value and time of intermediate solutions."""
+    """Track the objective value and time of intermediate solutions.
 
-    def __init__(self):
+    When a `listener` is given, it is called with the objective and the
+    schedule of each improving solution, read from the ShiftModel
+    `shift_model`. Setting the `cancel` event stops the search; `verbose`
+    writes each solution's objective to stderr.
+    """
+
+    def __init__(self, policy=None, listener=None, shift_model=None, cancel=None, verbose=False):
         cp_model.CpSolverSolutionCallback.__init__(self)
         self.__solution_count = 0
         self.__start_time = time.time()
+        self.__last_improvement = self.__start_time
+        self.__first_solution_time = None
+        self.__policy = policy
+        self.__listener = listener
+        self.__shift_model = shift_model
+        self.__cancel = cancel
+        self.__verbose = verbose
 
     def on_solution_callback(self):
         """Called on each new solution."""
         current_time = time.time()
         obj = self.ObjectiveValue()
-        sys.stderr.write('Solution %i, time = %0.2f s, objective = %i\n' %
-              (self.__solution_count, current_time - self.__start_time, obj))
+        if self.__verbose:
+            sys.stderr.write('Solution %i, time = %0.2f s, objective = %i\n' %
+                  (self.__solution_count, current_time - self.__start_time, obj))
         self.__solution_count += 1
+        self.__last_improvement = current_time
+        if self.__first_solution_time is None:
+            self.__first_solution_time = current_time - self.__start_time
+        if self.__listener is not None:
+            self.__listener(obj, self.current_schedule())
+
+    def current_schedule(self):
+        """Returns the schedule of the current solution."""
+        shift_model = self.__shift_model
+        return shift_model.days(shift_model.work_values(self.Response().solution))
 
     def solution_count(self):
         """Returns the number of solutions found."""
         return self.__solution_count
 
+    def first_solution_time(self):
+        """Returns the seconds until the first solution, or None."""
+        return self.__first_solution_time
+
+    def best_solution_time(self):
+        """Returns the seconds until the last (best) solution, or None."""
+        if not self.__solution_count:
+            return None
+        return self.__last_improvement - self.__start_time
+
+    def should_stop(self):
+        """Returns whether the search was cancelled or stalled per the policy."""
+        if self.__cancel is not None and self.__cancel.is_set():
+            return True
+        if self.__policy is None or self.__policy.stall_time is None:
+            return False
+        if not self.__solution_count:
+            return False
+        return time.time() - self.__last_improvement > self.__policy.stall_time
+
+
+def run_search(solver, model, solution_printer):
+    """Runs solver.Solve, stopping it early once the printer says so.
+
+    Solutions only reach the callback when they improve, so stalls and
+    cancellation are detected by a watchdog thread polling the printer.
+    """
+    done = threading.Event()
+
+    def watchdog():
+        while not done.wait(0.1):
+            if solution_printer.should_stop():
+                solver.StopSearch()
+                return
+
+    thread = threading.Thread(target=watchdog, daemon=True)
+    thread.start()
+    try:
+        return solver.Solve(model, solution_printer)
+    finally:
+        done.set()
+        thread.join()
+
+
+def solve_stats(solver, status, solution_printer, model, solve_time):
+    """Returns the stats of a search run by run_search.
+
+    The objective, bound and gap are None unless a solution was found.
+    """
+    found = status == cp_model.OPTIMAL or status == cp_model.FEASIBLE
+    proto = model.Proto()
+    stats = {
+        "solve_time": solve_time,
+        "first_solution_time": solution_printer.first_solution_time(),
+        "best_solution_time": solution_printer.best_solution_time(),
+        "variables": len(proto.variables),
+        "constraints": len(proto.constraints),
+        "status": solver.StatusName(status),
+        "objective": solver.ObjectiveValue() if found else None,
+        "bound": solver.BestObjectiveBound() if found else None,
+        "gap": None,
+        "solutions": solution_printer.solution_count(),
+        "conflicts": solver.NumConflicts(),
+        "branches": solver.NumBranches(),
+    }
+    if found:
+        objective, bound = stats["objective"], stats["bound"]
+        stats["gap"] = abs(objective - bound) / max(1.0, abs(objective))
+    return stats
+
+
+class Schedule(list):
+    """The `[[morning_doc, night_doc], ...]` list returned by a solve.
+
+    It serializes like a plain list; the name of the CP-SAT status that
+    produced it (OPTIMAL, FEASIBLE, INFEASIBLE, ...) is kept in `status`
+    and statistics about the solve in the `stats` dict. A found schedule
+    also carries the doc names in `docs` (UNFILLED last), the shifts each
+    worked in `totals`, the objective terms it did not avoid in
+    `violations`, as Violations, and the values of all work variables in `work_values` (see
+    ShiftModel.work_values), which also tell docs covering the same shift
+    apart.
+    """
+
+    def __init__(self, days=(), status="UNKNOWN", stats=None, docs=(), totals=(), violations=(),
+                 work_values=b""):
+        list.__init__(self, days)
+        self.status = status
+        self.stats = stats if stats is not None else {}
+        self.docs = docs
+        self.totals = totals
+        self.violations = violations
+        self.work_values = work_values
+
+    def penalty_report(self):
+        """Returns a line of text for each violation."""
+        lines = []
+        for label, value, coeff, counted in self.violations:
+            name = format_label(label, self.docs)
+            if counted:
+                lines.append("%s violated by %i, linear penalty=%i" % (name, value, coeff))
+            elif coeff > 0:
+                lines.append("%s violated, penalty=%i" % (name, coeff))
+            else:
+                lines.append("%s fulfilled, gain=%i" % (name, -coeff))
+        return lines
+
+
+class Violation(NamedTuple):
+    """An objective term a solution did not avoid.
+
+    Attributes:
+      label: the term's label, see format_label.
+      value: the value of its variable.
+      coeff: its objective coefficient.
+      counted: whether the variable is a count (an integer term, e.g. the
+        days missing from a run) rather than a literal. The same label can
+        be either: sequence rules use literals or counts by encoding.
+    """
+
+    label: tuple
+    value: int
+    coeff: int
+    counted: bool
+
+
+def format_label(label, docs):
+    """Describes the objective term labelled `label` in words.
+
+    Labels are tuples whose first item is the kind of term, followed by doc
+    indices into `docs`, shifts and days as built by build_model.
+    """
+    kind = label[0]
+    if kind == "combined_shift":
+        return "%s works both shifts of day %i" % (docs[label[1]], label[2])
+    if kind == "request":
+        return "%s's request about %s of day %i" % (docs[label[1]], SHIFTS[label[2]], label[3])
+    if kind == "shift_constraint":
+        return "%s's %s sequence rule" % (docs[label[1]], SHIFTS[label[2]])
+    if kind == "monthly_sum_constraint":
+        return "%s's total shifts" % docs[label[1]]
+    if kind == "weekly_sum_constraint":
+        return "%s's %s shifts in week %i" % (docs[label[1]], SHIFTS[label[2]], label[3])
+    if kind == "transition":
+        return "%s's %s to %s transition after day %i" % (
+            docs[label[1]], SHIFTS[label[2]], SHIFTS[label[3]], label[4]
+        )
+    if kind == "excess_demand":
+        return "excess %s cover on day %i" % (SHIFTS[label[1]], label[2])
+    if kind == "kept":
+        return "%s keeps %s of day %i" % (docs[label[1]], SHIFTS[label[2]], label[3])
+    return " ".join(str(item) for item in label)
+
 
 def negated_bounded_span(
     works, start: int, length: int
@@ -116,7 +365,8 @@ def add_soft_sequence_constraint(
         hard_max.
       max_cost: the coefficient of the linear penalty if the length is more than
         soft_max.
-      prefix: a base name for penalty literals.
+      prefix: a base name for penalty literals, or None to leave them
+        unnamed.
 
     Returns:
       a tuple (variables_list, coefficient_list) containing the different
@@ -135,8 +385,10 @@ def add_soft_sequence_constraint(
         for length in range(hard_min, soft_min):
             for start in range(len(works) - length + 1):
                 span = negated_bounded_span(works, start, length)
-                name = ": under_span(start=%i, length=%i)" % (start, length)
-                lit = model.NewBoolVar(prefix + name)
+                name = ""
+                if prefix is not None:
+                    name = prefix + ": under_span(start=%i, length=%i)" % (start, length)
+                lit = model.NewBoolVar(name)
                 span.append(lit)
                 model.AddBoolOr(span)
                 cost_literals.append(lit)
@@ -149,8 +401,10 @@ def add_soft_sequence_constraint(
         for length in range(soft_max + 1, hard_max + 1):
             for start in range(len(works) - length + 1):
                 span = negated_bounded_span(works, start, length)
-                name = ": over_span(start=%i, length=%i)" % (start, length)
-                lit = model.NewBoolVar(prefix + name)
+                name = ""
+                if prefix is not None:
+                    name = prefix + ": over_span(start=%i, length=%i)" % (start, length)
+                lit = model.NewBoolVar(name)
                 span.append(lit)
                 model.AddBoolOr(span)
                 cost_literals.append(lit)
@@ -163,6 +417,64 @@ def add_soft_sequence_constraint(
     return cost_literals, cost_coefficients
 
 
+def add_soft_sequence_counter_constraint(
+    model,
+    works,
+    hard_min,
+    soft_min,
+    min_cost,
+    soft_max,
+    hard_max,
+    max_cost,
+    prefix,
+):
+    """Same as add_soft_sequence_constraint, with a run-length encoding.
+
+    Instead of a clause per (start, length) span, an integer counter per
+    position holds the length of the run of true variables ending there.
+    The bounds and penalties are applied where a run ends. The model grows
+    linearly with len(works) instead of with len(works) * hard_max, and the
+    penalties are identical for any hard_min of at least 1.
+
+    Returns:
+      a tuple (variables_list, coefficient_list) of integer penalty
+      variables, which count the missing or excess length of each run.
+    """
+    cost_variables = []
+    cost_coefficients = []
+    min_length = max(hard_min, 1)
+    run = None
+    for i, var in enumerate(works):
+        # run == 0 off the sequence, previous run + 1 on it; the domain
+        # forbids runs longer than hard_max.
+        name = prefix + ": run(%i)" % i if prefix is not None else ""
+        next_run = model.NewIntVar(0, hard_max, name)
+        model.Add(next_run == 0).OnlyEnforceIf(var.Not())
+        if run is None:
+            model.Add(next_run == 1).OnlyEnforceIf(var)
+        else:
+            model.Add(next_run == run + 1).OnlyEnforceIf(var)
+        run = next_run
+
+        # The run ends here when the next variable is false.
+        ends = [var] if i + 1 == len(works) else [var, works[i + 1].Not()]
+        if hard_min > 1:
+            model.Add(run >= hard_min).OnlyEnforceIf(ends)
+        if min_cost > 0 and soft_min > min_length:
+            name = prefix + ": under_run(%i)" % i if prefix is not None else ""
+            under = model.NewIntVar(0, soft_min - min_length, name)
+            model.Add(under >= soft_min - run).OnlyEnforceIf(ends)
+            cost_variables.append(under)
+            cost_coefficients.append(min_cost)
+        if max_cost > 0 and soft_max < hard_max:
+            name = prefix + ": over_run(%i)" % i if prefix is not None else ""
+            over = model.NewIntVar(0, hard_max - soft_max, name)
+            model.Add(over >= run - soft_max).OnlyEnforceIf(ends)
+            cost_variables.append(over)
+            cost_coefficients.append(max_cost)
+    return cost_variables, cost_coefficients
+
+
 def add_soft_sum_constraint(
     model,
     works,
@@ -195,7 +507,8 @@ def add_soft_sum_constraint(
         hard_max.
       max_cost: the coefficient of the linear penalty if the sum is more than
         soft_max.
-      prefix: a base name for penalty variables.
+      prefix: a base name for penalty variables, or None to leave them
+        unnamed.
 
     Returns:
       a tuple (variables_list, coefficient_list) containing the different
@@ -205,14 +518,14 @@ def add_soft_sum_constraint(
     cost_coefficients = []
     sum_var = model.NewIntVar(hard_min, hard_max, "")
     # This adds the hard constraints on the sum.
-    model.Add(sum_var == sum(works))
+    model.Add(sum_var == cp_model.LinearExpr.Sum(works))
 
     # Penalize sums below the soft_min target.
     if soft_min > hard_min and min_cost > 0:
         delta = model.NewIntVar(-len(works), len(works), "")
         model.Add(delta == soft_min - sum_var)
         # TODO(user): Compare efficiency with only excess >= soft_min - sum_var.
-        excess = model.NewIntVar(0, 7, prefix + ": under_sum")
+        excess = model.NewIntVar(0, 7, prefix + ": under_sum" if prefix is not None else "")
         model.AddMaxEquality(excess, [delta, 0])
         cost_variables.append(excess)
         cost_coefficients.append(min_cost)
@@ -221,7 +534,7 @@ def add_soft_sum_constraint(
     if soft_max < hard_max and max_cost > 0:
         delta = model.NewIntVar(-7, 7, "")
         model.Add(delta == sum_var - soft_max)
-        excess = model.NewIntVar(0, 7, prefix + ": over_sum")
+        excess = model.NewIntVar(0, 7, prefix + ": over_sum" if prefix is not None else "")
         model.AddMaxEquality(excess, [delta, 0])
         cost_variables.append(excess)
         cost_coefficients.append(max_cost)
@@ -229,14 +542,196 @@ def add_soft_sum_constraint(
     return cost_variables, cost_coefficients
 
 
-OFF = 0
-MORNING = 1
-NIGHT = 2
-UNFILLED = "Unfilled"
+def add_lex_greater_or_equal(model, larger, smaller):
+    """Adds the constraint that `larger` is lexicographically >= `smaller`.
+
+    Both are lists of Boolean variables of the same length. equal[i] is
+    forced true while the first i positions are equal; whenever it is, the
+    next position of `larger` must be at least that of `smaller`.
+    """
+    equal = None
+    for i, (a, b) in enumerate(zip(larger, smaller)):
+        # With the prefix equal (or empty), b implies a.
+        prefix = [] if equal is None else [equal.Not()]
+        model.AddBoolOr(prefix + [a, b.Not()])
+        if i == len(larger) - 1:
+            break
+        next_equal = model.NewBoolVar("")
+        model.AddBoolOr(prefix + [a.Not(), b.Not(), next_equal])
+        model.AddBoolOr(prefix + [a, b, next_equal])
+        equal = next_equal
+
+
+def symmetry_classes(docs, desired_total_shifts, requested, prefer_double_shifts):
+    """Groups the docs that can be swapped in any schedule.
+
+    Two docs are interchangeable when they have the same bounds, the same
+    prefer_double flag and no requests within the horizon, since every
+    other constraint treats all docs alike.
+
+    Args:
+      docs: the doc names, UNFILLED excluded.
+      desired_total_shifts, prefer_double_shifts: as for build_model.
+      requested: the indices of the docs with requests in the horizon.
+
+    Returns:
+      the classes of two or more doc indices, each in increasing order.
+    """
+    classes = {}
+    for e, doc in enumerate(docs):
+        if e in requested:
+            continue
+        key = (tuple(desired_total_shifts[doc]), prefer_double_shifts.get(doc))
+        classes.setdefault(key, []).append(e)
+    return [members for members in classes.values() if len(members) > 1]
+
+
+def request_terms(doc_index, preferences, unavailable):
+    """Returns the (employee, shift, day, weight) requests of the docs.
+
+    A negative weight indicates that the employee desire this assignment.
+    """
+    requests = []
+    for doc in preferences:
+        doc_id = doc_index[doc]
+        requests += [(doc_id, shift, day, -2) for day, shift in preferences[doc]]
+
+    for doc in unavailable:
+        doc_id = doc_index[doc]
+        requests += [(doc_id, shift, day, 10) for day, shift in unavailable[doc]]
+    return requests
+
+
 MAX_UNFILLED = 7
+SHIFTS = ["O", "M", "N"]
+
+
+class ShiftModel:
+    """A built scheduling model and what is needed to read solutions back.
+
+    Attributes:
+      model: the cp_model.CpModel.
+      docs: the doc names, UNFILLED last.
+      num_days: the horizon.
+      work: work[e][s][d] is true when doc e works shift s on day d. The
+        variables are created as one dense block in (e, s, d) order.
+      obj_bool_vars, obj_bool_coeffs, obj_int_vars, obj_int_coeffs: the
+        linear terms of the minimized objective; call minimize() again after
+        adding terms.
+      obj_bool_labels, obj_int_labels: a label tuple for each term, see
+        format_label.
+      total_vars: the variable holding each doc's total shifts, bounded by
+        its desired (min, max).
+      hinted: (shift, day) -> doc index of the solution hint, if any.
+      symmetry_classes: the classes of interchangeable docs, see
+        symmetry_classes.
+    """
 
+    def __init__(self, model, docs, num_days, work):
+        self.model = model
+        self.docs = docs
+        self.num_days = num_days
+        self.work = work
+        self.obj_bool_vars: list[cp_model.BoolVar] = []
+        self.obj_bool_coeffs: list[int] = []
+        self.obj_bool_labels: list[tuple] = []
+        self.obj_int_vars: list[cp_model.IntVar] = []
+        self.obj_int_coeffs: list[int] = []
+        self.obj_int_labels: list[tuple] = []
+        self.total_vars: list[cp_model.IntVar] = []
+        self.hinted = {}
+        self.symmetry_classes = []
+
+    def set_hint(self, hint):
+        """Replaces the solution hint with a schedule.
+
+        Every work variable of a hinted day gets a value, so CP-SAT can
+        start from the schedule as its first incumbent.
+        """
+        model, work = self.model, self.work
+        num_employees = len(self.docs)
+        num_shifts = len(SHIFTS)
+        model.ClearHints()
+        hinted = self.hinted = {}
+        for d, day_shifts in enumerate(hint[:self.num_days]):
+            for s in range(1, num_shifts):
+                e = day_shifts[s - 1]
+                if e is None or not 0 <= e < num_employees - 1:
+                    e = num_employees - 1
+                hinted[s, d] = e
+            for e in range(num_employees):
+                on_shift = [hinted[s, d] == e for s in range(1, num_shifts)]
+                model.AddHint(work[e][OFF][d], not any(on_shift))
+                for s in range(1, num_shifts):
+                    model.AddHint(work[e][s][d], on_shift[s - 1])
+
+    def unfilled(self):
+        """Returns the number of shifts left to UNFILLED, as an expression."""
+        return cp_model.LinearExpr.Sum(self.work[-1][MORNING] + self.work[-1][NIGHT])
+
+    def minimize(self):
+        """Sets the model objective to the current objective terms."""
+        self.model.Minimize(
+            cp_model.LinearExpr.WeightedSum(self.obj_bool_vars, self.obj_bool_coeffs)
+            + cp_model.LinearExpr.WeightedSum(self.obj_int_vars, self.obj_int_coeffs)
+        )
 
-def solve_shift_scheduling(
+    def work_values(self, solution):
+        """Returns the work variables' values in a solution, in one read.
+
+        Args:
+          solution: the values of all model variables, e.g. the `solution`
+            field of a CpSolverResponse.
+
+        Returns:
+          bytes where the value of work[e][s][d] is at
+          (e * len(SHIFTS) + s) * num_days + d.
+        """
+        first = self.work[0][0][0].Index()
+        size = len(self.docs) * len(SHIFTS) * self.num_days
+        return bytes(itertools.islice(solution, first, first + size))
+
+    def days(self, values):
+        """Returns the `[[morning_doc, night_doc], ...]` list of work_values.
+
+        Shifts left to UNFILLED are None.
+        """
+        num_days = self.num_days
+        days = [[None, None] for d in range(num_days)]
+        for e in range(len(self.docs) - 1):
+            for s in (MORNING, NIGHT):
+                start = (e * len(SHIFTS) + s) * num_days
+                d = values.find(1, start, start + num_days)
+                while d >= 0:
+                    days[d - start][s - 1] = e
+                    d = values.find(1, d + 1, start + num_days)
+        return days
+
+    def totals(self, values):
+        """Returns the shifts worked by each doc in work_values."""
+        num_days = self.num_days
+        totals = []
+        for e in range(len(self.docs)):
+            start = (e * len(SHIFTS) + MORNING) * num_days
+            totals.append(values.count(1, start, start + 2 * num_days))
+        return totals
+
+    def violations(self, solution):
+        """Returns the Violation of each objective term that is nonzero in
+        a solution, as for work_values.
+        """
+        violations = []
+        for variables, coeffs, labels, counted in (
+                (self.obj_bool_vars, self.obj_bool_coeffs, self.obj_bool_labels, False),
+                (self.obj_int_vars, self.obj_int_coeffs, self.obj_int_labels, True)):
+            for var, coeff, label in zip(variables, coeffs, labels):
+                value = solution[var.Index()]
+                if value:
+                    violations.append(Violation(label, value, coeff, counted))
+        return violations
+
+
+def build_model(
         docs: list[str],
         # doc -> (min, max)
         desired_total_shifts: dict[str, tuple],
@@ -248,14 +743,40 @@ def solve_shift_scheduling(
         prefer_double_shifts: dict[str, bool],
         max_unfilled: int,
         num_days: int,
+        # [[morning_doc, night_doc], ...] from a previous solve
+        hint: list[list] | None = None,
+        name_vars: bool = False,
+        # rules.Rules, DEFAULT_RULES if None
+        rules=None,
+        break_symmetry: bool = False,
+        # cp_model.CpModel to add to, e.g. one shared by several sites
+        model=None,
 ):
-    """Solves the shift scheduling problem."""
+    """Builds the shift scheduling model.
+
+    Variable names only help when debugging the model or reading the
+    penalty report, so they are left empty unless `name_vars` is set.
+    Only the rule families present in `rules` are compiled into the model.
+    With `model`, the variables and constraints are added to it rather than
+    to a new model, and its objective is replaced by this one's.
+
+    Classes of interchangeable docs are always detected. With
+    `break_symmetry` they are also ordered so that the first works
+    earliest, which leaves one of their permutations to search; this is
+    skipped when a `hint` is given, since the hinted schedule need not be in
+    that order. CP-SAT's presolve finds most of these symmetries by itself,
+    and on the rosters tried the extra constraints slowed the search down,
+    so they are off by default.
+
+    Returns:
+      a ShiftModel.
+    """
     # Data
-    docs += [UNFILLED]
+    docs = list(docs) + [UNFILLED]
+    desired_total_shifts = dict(desired_total_shifts)
     desired_total_shifts[UNFILLED] = (0, max_unfilled)
     num_employees = len(docs)
-    num_weeks = math.ceil(num_days / 7)
-    shifts = ["O", "M", "N"]
+    doc_index = {doc: e for e, doc in enumerate(docs)}
 
     # Fixed assignment: (employee, shift, day).
     # This fixes the first 2 days of the schedule.
@@ -278,111 +799,66 @@ def solve_shift_scheduling(
     # (7, 3, 1),
     #]
 
-    # Request: (employee, shift, day, weight)
-    # A negative weight indicates that the employee desire this assignment.
-    #requests = [
-    # Employee 3 does not want to work on the first Saturday (negative weight
-    # for the Off shift).
-    #(3, 0, 5, -2),
-    # Employee 5 wants a night shift on the second Thursday (negative weight).
-    #(5, 3, 10, -2),
-    # Employee 2 does not want a night shift on the first Friday (positive
-    # weight).
-    #(2, 3, 4, 4),
-    #]
+    requests = request_terms(doc_index, preferences, unavailable)
 
-    requests = []
-    for doc in preferences:
-        doc_id = docs.index(doc)
-        for preference in preferences[doc]:
-            requests += [(doc_id, preference[1], preference[0], -2)]
+    if rules is None:
+        rules = DEFAULT_RULES
+    compiled = compile_rules(rules, num_days)
 
-    for doc in unavailable:
-        doc_id = docs.index(doc)
-        for data in unavailable[doc]:
-            requests += [(doc_id, data[1], data[0], 10)]
-
-    # Shift constraints on continuous sequence :
-    #     (shift, hard_min, soft_min, min_penalty,
-    #             soft_max, hard_max, max_penalty)
-    shift_constraints = [
-        # One or two consecutive days of rest, this is a hard constraint.
-        #(OFF, 1, 1, 0, 2, 2, 0),
-        # between 2 and 3 consecutive days of night shifts, 1 and 4 are
-        # possible but penalized.
-        #(NIGHT, 1, 2, 20, 3, 4, 5),
-    ]
-
-    # Weekly sum constraints on shifts days:
-    #     (shift, hard_min, soft_min, min_penalty,
-    #             soft_max, hard_max, max_penalty)
-    weekly_sum_constraints = [
-        # Constraints on rests per week.
-        #(OFF, 1, 2, 7, 2, 3, 4),
-        # At least 1 night shift per week (penalized). At most 4 (hard).
-        #(NIGHT, 0, 1, 3, 4, 4, 0),
-    ]
-
-    # Penalized transitions:
-    #     (previous_shift, next_shift, penalty (0 means forbidden))
-    penalized_transitions = [
-        # Afternoon to night has a penalty of 4.
-        #(2, 3, 4),
-        # Night to morning is forbidden.
-        (NIGHT, MORNING, 0),
-    ]
-
-    # daily demands for work shifts (morning, night) for each day
-    # of the week starting on Monday.
-    weekly_cover_demands = [
-        (1, 1),  # Monday
-        (1, 1),  # Tuesday
-        (1, 1),  # Wednesday
-        (1, 1),  # Thursday
-        (1, 1),  # Friday
-        (1, 1),  # Saturday
-        (1, 1),  # Sunday
-    ]
-
-    # Penalty for exceeding the cover constraint per shift type.
-    excess_cover_penalties = (2, 2, 5)
-
-    #num_days = num_weeks * 7
-    num_shifts = len(shifts)
-
-    model = cp_model.CpModel()
-
-    work = {}
-    for e in range(num_employees):
-        for s in range(num_shifts):
-            for d in range(num_days):
-                work[e, s, d] = model.NewBoolVar("work%i_%i_%i" % (e, s, d))
+    num_shifts = len(SHIFTS)
+
+    if model is None:
+        model = cp_model.CpModel()
+
+    # One dense block of work variables, indexed work[e][s][d].
+    if name_vars:
+        work = [
+            [[model.NewBoolVar("work%i_%i_%i" % (e, s, d)) for d in range(num_days)]
+             for s in range(num_shifts)]
+            for e in range(num_employees)
+        ]
+    else:
+        work = [
+            [[model.NewBoolVar("") for d in range(num_days)] for s in range(num_shifts)]
+            for e in range(num_employees)
+        ]
+    shift_model = ShiftModel(model, docs, num_days, work)
+
+    if hint:
+        shift_model.set_hint(hint)
 
     # Linear terms of the objective in a minimization context.
-    obj_int_vars: list[cp_model.IntVar] = []
-    obj_int_coeffs: list[int] = []
-    obj_bool_vars: list[cp_model.BoolVar] = []
-    obj_bool_coeffs: list[int] = []
+    obj_int_vars = shift_model.obj_int_vars
+    obj_int_coeffs = shift_model.obj_int_coeffs
+    obj_int_labels = shift_model.obj_int_labels
+    obj_bool_vars = shift_model.obj_bool_vars
+    obj_bool_coeffs = shift_model.obj_bool_coeffs
+    obj_bool_labels = shift_model.obj_bool_labels
 
     # Exactly one shift per day unless otherwise specified.
     for doc in prefer_double_shifts:
-        e = docs.index(doc)
+        e = doc_index[doc]
+        morning, night = work[e][MORNING], work[e][NIGHT]
         if not prefer_double_shifts[doc]:
             for d in range(num_days):
-                model.AddExactlyOne(work[e, s, d] for s in range(num_shifts))
+                model.AddExactlyOne(work[e][s][d] for s in range(num_shifts))
         else:
             for d in range(num_days):
-                a = [work[e, MORNING, d], work[e, NIGHT, d].Not()]
+                a = [morning[d], night[d].Not()]
                 a_orig = a.copy()
-                b = [work[e, MORNING, d].Not(), work[e, NIGHT, d]]
+                b = [morning[d].Not(), night[d]]
                 b_orig = b.copy()
 
-                trans_var_a = model.NewBoolVar(
-                     "combined_shift_constraint_a (employee=%i, day=%i)" % (e, d)
-                )
-                trans_var_b = model.NewBoolVar(
-                     "combined_shift_constraint_b (employee=%i, day=%i)" % (e, d)
-                )
+                if name_vars:
+                    trans_var_a = model.NewBoolVar(
+                         "combined_shift_constraint_a (employee=%i, day=%i)" % (e, d)
+                    )
+                    trans_var_b = model.NewBoolVar(
+                         "combined_shift_constraint_b (employee=%i, day=%i)" % (e, d)
+                    )
+                else:
+                    trans_var_a = model.NewBoolVar("")
+                    trans_var_b = model.NewBoolVar("")
 
                 a.append(trans_var_a)
                 b.append(trans_var_b)
@@ -392,50 +868,61 @@ def solve_shift_scheduling(
 
                 obj_bool_vars.append(trans_var_a)
                 obj_bool_coeffs.append(2)
+                obj_bool_labels.append(("combined_shift", e, d))
 
                 obj_bool_vars.append(trans_var_b)
                 obj_bool_coeffs.append(2)
+                obj_bool_labels.append(("combined_shift", e, d))
 
     # Fixed assignments.
     #for e, s, d in fixed_assignments:
-    #    model.Add(work[e, s, d] == 1)
+    #    model.Add(work[e][s][d] == 1)
 
     # Employee requests
     for e, s, d, w in requests:
         if d >= num_days:
             continue
-        obj_bool_vars.append(work[e, s, d])
+        obj_bool_vars.append(work[e][s][d])
         obj_bool_coeffs.append(w)
+        obj_bool_labels.append(("request", e, s, d))
 
     # Shift constraints
-    for ct in shift_constraints:
-        shift, hard_min, soft_min, min_cost, soft_max, hard_max, max_cost = ct
+    for ct in rules.shift_constraints:
+        shift, hard_min, soft_min, min_cost, soft_max, hard_max, max_cost, encoding = ct
+        if encoding == "counter":
+            add_sequence = add_soft_sequence_counter_constraint
+            cost_vars, cost_coeffs, cost_labels = obj_int_vars, obj_int_coeffs, obj_int_labels
+        else:
+            add_sequence = add_soft_sequence_constraint
+            cost_vars, cost_coeffs, cost_labels = obj_bool_vars, obj_bool_coeffs, obj_bool_labels
         for e in range(num_employees - 1):
-            works = [work[e, shift, d] for d in range(num_days)]
-            variables, coeffs = add_soft_sequence_constraint(
+            variables, coeffs = add_sequence(
                 model,
-                works,
+                work[e][shift],
                 hard_min,
                 soft_min,
                 min_cost,
                 soft_max,
                 hard_max,
                 max_cost,
-                "shift_constraint(employee %i, shift %i)" % (e, shift),
+                "shift_constraint(employee %i, shift %i)" % (e, shift) if name_vars else None,
             )
-            obj_bool_vars.extend(variables)
-            obj_bool_coeffs.extend(coeffs)
+            cost_vars.extend(variables)
+            cost_coeffs.extend(coeffs)
+            cost_labels.extend([("shift_constraint", e, shift)] * len(variables))
 
     # Monthly sum constraints
     for e in range(num_employees):
         doc = docs[e]
         desired_min, desired_max = desired_total_shifts[doc]
-        works = [work[e, shift, d] for d in range(num_days) for shift in range(1, num_shifts)]
+        works = work[e][MORNING] + work[e][NIGHT]
         if e == num_employees - 1:
             soft_desired_max = desired_min
         else:
             soft_desired_max = desired_max
         cost = 2 if e != num_employees - 1 else 10
+        # add_soft_sum_constraint creates the sum variable first.
+        total_index = len(model.Proto().variables)
         variables, coeffs = add_soft_sum_constraint(
             model,
             works,
@@ -446,18 +933,19 @@ def solve_shift_scheduling(
             desired_max, # hard max
             #int(desired_max * 1.2), # hard max
             cost, # max cost
-            "monthly_sum_constraint(employee %i)"
-            % (e),
+            "monthly_sum_constraint(employee %i)" % (e) if name_vars else None,
         )
         obj_int_vars.extend(variables)
         obj_int_coeffs.extend(coeffs)
+        obj_int_labels.extend([("monthly_sum_constraint", e)] * len(variables))
+        shift_model.total_vars.append(model.GetIntVarFromProtoIndex(total_index))
 
     # Weekly sum constraints
-    for ct in weekly_sum_constraints:
+    for ct in rules.weekly_sum_constraints:
         shift, hard_min, soft_min, min_cost, soft_max, hard_max, max_cost = ct
         for e in range(num_employees - 1):
-            for w in range(num_weeks):
-                works = [work[e, shift, d + w * 7] for d in range(7)]
+            for w, (week_start, week_end) in enumerate(compiled.weeks):
+                works = work[e][shift][week_start:week_end]
                 variables, coeffs = add_soft_sum_constraint(
                     model,
                     works,
@@ -468,151 +956,296 @@ def solve_shift_scheduling(
                     hard_max,
                     max_cost,
                     "weekly_sum_constraint(employee %i, shift %i, week %i)"
-                    % (e, shift, w),
+                    % (e, shift, w) if name_vars else None,
                 )
                 obj_int_vars.extend(variables)
                 obj_int_coeffs.extend(coeffs)
+                obj_int_labels.extend([("weekly_sum_constraint", e, shift, w)] * len(variables))
 
     # Penalized transitions
-    for previous_shift, next_shift, cost in penalized_transitions:
+    for previous_shift, next_shift, cost in rules.penalized_transitions:
         for e in range(num_employees - 1):
+            previous_works, next_works = work[e][previous_shift], work[e][next_shift]
             for d in range(num_days - 1):
-                transition = [
-                    work[e, previous_shift, d].Not(),
-                    work[e, next_shift, d + 1].Not(),
-                ]
+                transition = [previous_works[d].Not(), next_works[d + 1].Not()]
                 if cost == 0:
                     model.AddBoolOr(transition)
                 else:
                     trans_var = model.NewBoolVar(
-                        "transition (employee=%i, day=%i)" % (e, d)
+                        "transition (employee=%i, day=%i)" % (e, d) if name_vars else ""
                     )
                     transition.append(trans_var)
                     model.AddBoolOr(transition)
                     obj_bool_vars.append(trans_var)
                     obj_bool_coeffs.append(cost)
+                    obj_bool_labels.append(("transition", e, previous_shift, next_shift, d))
 
     # Cover constraints
+    cover_penalties = dict(compiled.cover_penalties)
     for s in range(1, num_shifts):
-        for w in range(num_weeks):
-            for d in range(7):
-                if w * 7 + d >= num_days:
-                    continue
-                works = [work[e, s, w * 7 + d] for e in range(num_employees)]
-                # Ignore Off shift.
-                min_demand = weekly_cover_demands[d][s - 1]
-                worked = model.NewIntVar(min_demand, num_employees - 1, "")
-                model.Add(worked == sum(works))
-                over_penalty = excess_cover_penalties[s - 1]
-                if over_penalty > 0:
-                    name = "excess_demand(shift=%i, week=%i, day=%i)" % (s, w, d)
-                    excess = model.NewIntVar(0, num_employees - min_demand - 1, name)
-                    model.Add(excess == worked - min_demand)
-                    obj_int_vars.append(excess)
-                    obj_int_coeffs.append(over_penalty)
+        over_penalty = cover_penalties.get(s)
+        for day in range(num_days):
+            works = [work[e][s][day] for e in range(num_employees)]
+            # Ignore Off shift. Every doc, UNFILLED included, covers it at most
+            # once, as diagnose.precheck assumes.
+            min_demand = compiled.day_demands[day][s - 1]
+            worked = model.NewIntVar(min_demand, num_employees, "")
+            model.Add(worked == cp_model.LinearExpr.Sum(works))
+            if over_penalty:
+                w, d = divmod(day, 7)
+                name = "excess_demand(shift=%i, week=%i, day=%i)" % (s, w, d) if name_vars else ""
+                excess = model.NewIntVar(0, num_employees - min_demand, name)
+                model.Add(excess == worked - min_demand)
+                obj_int_vars.append(excess)
+                obj_int_coeffs.append(over_penalty)
+                obj_int_labels.append(("excess_demand", s, day))
+
+    # Symmetry breaking: the morning and night work vectors of
+    # interchangeable docs, day by day, must be in decreasing lexicographic
+    # order.
+    requested = {e for e, s, d, w in requests if d < num_days}
+    shift_model.symmetry_classes = symmetry_classes(
+        docs[:-1], desired_total_shifts, requested, prefer_double_shifts
+    )
+    if break_symmetry and not hint:
+        for members in shift_model.symmetry_classes:
+            vectors = [
+                [work[e][s][d] for d in range(num_days) for s in (MORNING, NIGHT)]
+                for e in members
+            ]
+            for larger, smaller in zip(vectors, vectors[1:]):
+                add_lex_greater_or_equal(model, larger, smaller)
+
+    # The UNFILLED shift is off exactly when it covers neither shift, so
+    # its otherwise unconstrained off days add no equivalent solutions.
+    e = num_employees - 1
+    for d in range(num_days):
+        off, morning, night = (work[e][s][d] for s in range(num_shifts))
+        model.AddBoolOr([off, morning, night])
+        model.AddImplication(morning, off.Not())
+        model.AddImplication(night, off.Not())
 
     # Objective
-    model.Minimize(
-        sum(obj_bool_vars[i] * obj_bool_coeffs[i] for i in range(len(obj_bool_vars)))
-        + sum(obj_int_vars[i] * obj_int_coeffs[i] for i in range(len(obj_int_vars)))
-    )
+    shift_model.minimize()
 
     #if output_proto:
     #    print("Writing proto to %s" % output_proto)
     #    with open(output_proto, "w") as text_file:
     #        text_file.write(str(model))
 
-    # Solve the model.
+    return shift_model
+
+
+def make_solver(model, policy=DEFAULT_POLICY, num_workers=None, parameters=None):
+    """Returns a CpSolver configured by `policy` for solving `model`.
+
+    `parameters` maps further SatParameters field names to values; enum
+    fields take the name of the value, e.g. "FIXED_SEARCH".
+
+    Raises:
+      ValueError: for an unknown field or enum value name.
+    """
+    if isinstance(policy, str):
+        policy = POLICIES[policy]
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 10
+    solver.parameters.max_time_in_seconds = policy.time_limit(len(model.Proto().variables))
+    solver.parameters.relative_gap_limit = policy.relative_gap
+    solver.parameters.num_workers = num_workers or os.cpu_count() or 1
+    fields = sat_parameters_pb2.SatParameters.DESCRIPTOR.fields_by_name
+    for name, value in (parameters or {}).items():
+        if name not in fields:
+            raise ValueError("unknown solver parameter %r" % name)
+        enum_type = fields[name].enum_type
+        if enum_type is not None and isinstance(value, str):
+            if value not in enum_type.values_by_name:
+                raise ValueError("%s must be one of %s" % (name, ", ".join(enum_type.values_by_name)))
+            # The field reads as its enum type or as an int, depending on
+            # the SatParameters implementation; both convert its number.
+            value = type(getattr(solver.parameters, name))(enum_type.values_by_name[value].number)
+        setattr(solver.parameters, name, value)
+    return solver
+
+
+def solve_shift_scheduling(
+        docs: list[str],
+        # doc -> (min, max)
+        desired_total_shifts: dict[str, tuple],
+        # doc -> [(day, shift)]
+        preferences: dict[str, list[tuple]],
+        # doc -> [(day, shift)]
+        unavailable: dict[str, list[tuple]],
+        # doc -> [bool]
+        prefer_double_shifts: dict[str, bool],
+        max_unfilled: int,
+        num_days: int,
+        # [[morning_doc, night_doc], ...] from a previous solve
+        hint: list[list] | None = None,
+        # StopPolicy, or the name of one in POLICIES
+        policy=DEFAULT_POLICY,
+        num_workers: int | None = None,
+        # called with (objective, schedule) for each improving solution
+        listener=None,
+        # threading.Event that stops the search when set
+        cancel=None,
+        name_vars: bool = False,
+        # SatParameters field -> value
+        parameters: dict | None = None,
+        # rules.Rules, DEFAULT_RULES if None
+        rules=None,
+        break_symmetry: bool = False,
+        # writes solutions, the schedule and its penalties to stderr
+        verbose: bool = False,
+        # templates.TemplateCache to build the model from
+        templates=None,
+        # called with each line of CP-SAT's search log
+        log_callback=None,
+):
+    """Solves the shift scheduling problem.
+
+    A previous schedule, in the same format as the one returned, can be
+    passed as `hint` to warm-start the search. `policy` decides when the
+    search stops, and `num_workers` defaults to the number of cores;
+    `parameters` can override any other CP-SAT parameter. Intermediate
+    schedules are passed to `listener` as they are found. `rules` replaces
+    the default rule tables, and `break_symmetry` orders interchangeable
+    docs, see build_model. With `templates`, the model is patched from a
+    cached one of the same shape instead of being built from scratch;
+    models with symmetry breaking or variable names are always built.
+    `log_callback` turns on CP-SAT's search progress log and receives it
+    line by line instead of stdout.
+
+    The returned Schedule's `stats` holds build_time, solve_time,
+    first_solution_time and best_solution_time (in seconds), the model's
+    variables and constraints counts, status, objective, bound, gap,
+    solutions, conflicts and branches, the number of symmetry_classes of
+    interchangeable docs, the number of `unfilled` shifts when a schedule
+    is found, plus hint_survival when hinted. A found Schedule also has the
+    docs' totals and the violated objective terms.
+    """
+    start = time.perf_counter()
+    if templates is not None and not break_symmetry and not name_vars:
+        shift_model = templates.build_model(
+            docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+            max_unfilled, num_days, hint, rules,
+        )
+    else:
+        shift_model = build_model(
+            docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts,
+            max_unfilled, num_days, hint, name_vars, rules, break_symmetry,
+        )
+    build_time = time.perf_counter() - start
+    schedule = solve_model(
+        shift_model, policy, num_workers, listener, cancel, parameters, verbose, log_callback
+    )
+    schedule.stats["build_time"] = build_time
+    return schedule
+
+
+def solve_model(
+        shift_model,
+        policy=DEFAULT_POLICY,
+        num_workers: int | None = None,
+        listener=None,
+        cancel=None,
+        parameters: dict | None = None,
+        verbose: bool = False,
+        log_callback=None,
+):
+    """Solves a built ShiftModel; see solve_shift_scheduling."""
+    if isinstance(policy, str):
+        policy = POLICIES[policy]
+    model = shift_model.model
+    num_days = shift_model.num_days
+    hinted = shift_model.hinted
+    num_employees = len(shift_model.docs)
+    num_weeks = math.ceil(num_days / 7)
+    num_shifts = len(SHIFTS)
+
+    # Solve the model.
+    solver = make_solver(model, policy, num_workers, parameters)
+    if log_callback is not None:
+        solver.parameters.log_search_progress = True
+        solver.parameters.log_to_stdout = False
+        solver.log_callback = log_callback
     #if params:
     #    text_format.Parse(params, solver.parameters)
     #solution_printer = cp_model.ObjectiveSolutionPrinter()
-    solution_printer = SolutionPrinter()
-    status = solver.Solve(model, solution_printer)
-
-    # print("Statistics")
-    # print("  - status          : %s" % solver.StatusName(status))
-    # print("  - conflicts       : %i" % solver.NumConflicts())
-    # print("  - branches        : %i" % solver.NumBranches())
-    # print("  - wall time       : %f s" % solver.WallTime())
-    # print()
+    solution_printer = SolutionPrinter(policy, listener, shift_model, cancel, verbose)
+    start = time.perf_counter()
+    status = run_search(solver, model, solution_printer)
+    solve_time = time.perf_counter() - start
+
+    stats = solve_stats(solver, status, solution_printer, model, solve_time)
+    stats["symmetry_classes"] = len(shift_model.symmetry_classes)
+    found = stats["objective"] is not None
+
+    if not found:
+        return Schedule([], solver.StatusName(status), stats)
+
+    # Read the solution once; everything below works on these values.
+    solution = list(solver.ResponseProto().solution)
+    values = shift_model.work_values(solution)
+    totals = shift_model.totals(values)
+    stats["unfilled"] = totals[-1]
+    if hinted:
+        # Share of the hinted (shift, day) slots the solution kept.
+        kept = sum(
+            1 for (s, d), e in hinted.items() if values[(e * num_shifts + s) * num_days + d]
+        )
+        stats["hint_survival"] = kept / len(hinted)
+    schedule = Schedule(
+        shift_model.days(values), solver.StatusName(status), stats,
+        shift_model.docs, totals, shift_model.violations(solution), values,
+    )
 
     # Print solution.
-    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+    if verbose:
         sys.stderr.write("\n")
         for w in range(num_weeks):
             header = "          "
             header += "M     T     W     T     F     S     S \n"
             sys.stderr.write(header)
             for e in range(num_employees):
-                schedule = ""
+                line = ""
                 for d in range(w * 7, (w + 1) * 7):
                     if d >= num_days:
                         continue
                     for s in range(num_shifts):
-                        if solver.BooleanValue(work[e, s, d]):
-                            schedule += shifts[s] + " "
+                        if values[(e * num_shifts + s) * num_days + d]:
+                            line += SHIFTS[s] + " "
                         else:
-                            schedule += "  "
-                sys.stderr.write("worker %i: %s\n" % (e, schedule))
+                            line += "  "
+                sys.stderr.write("worker %i: %s\n" % (e, line))
             sys.stderr.write("\n")
         sys.stderr.write("\n")
         sys.stderr.write("Penalties:\n")
-        for i, var in enumerate(obj_bool_vars):
-            if solver.BooleanValue(var):
-                penalty = obj_bool_coeffs[i]
-                if penalty > 0:
-                    #pass
-                    sys.stderr.write(f"  {var.Name()} violated, penalty={penalty}\n")
-                else:
-                    #pass
-                    sys.stderr.write(f"  {var.Name()} fulfilled, gain={-penalty}\n")
-
-        for i, var in enumerate(obj_int_vars):
-            if solver.Value(var) > 0:
-                pass
-                sys.stderr.write(
-                    "  %s violated by %i, linear penalty=%i\n"
-                    % (var.Name(), solver.Value(var), obj_int_coeffs[i])
-                )
+        for line in schedule.penalty_report():
+            sys.stderr.write("  %s\n" % line)
+        if hinted:
+            sys.stderr.write("Hint survival: %0.2f\n" % stats["hint_survival"])
+    return schedule
 
-        schedule = []
-        for d in range(num_days):
-            shifts = [None, None]
-            for s in range(1, num_shifts):
-                for e in range(num_employees - 1):
-                    if solver.BooleanValue(work[e, s, d]):
-                        shifts[s - 1] = e
-            schedule += [shifts]
-        return schedule
 
-    return []
+def process_inputs(contents):
+    return process_docs(json.loads(contents))
+
 
+def process_docs(inputs):
+    """Returns the build_model inputs for a decoded doc list.
 
-def process_inputs(contents):
-    inputs = json.loads(contents)
-    docs = []
-    preferences = {}
-    unavailable = {}
-    desired = {}
-    prefer_double = {}
-    for doc in inputs:
-        name = doc["name"]
-        docs += [name]
-        # todo: supprt shift pefs
-        preferences[name] = sum(map(lambda x: [(x, MORNING), (x, NIGHT)], doc["preferred"]), [])
-        unavailable[name] = sum(map(lambda x: [(x, MORNING), (x, NIGHT)], doc["unavailable"]), [])
-        desired[name] = (doc["min"], doc["max"])
-        prefer_double[name] = doc["prefer_double"]
-    return (docs, desired, preferences, unavailable, prefer_double)
+    Raises ValueError for invalid docs, see roster.parse_roster.
+    """
+    return roster.parse_roster(inputs).inputs()
 
 
 def main():
     with open('inputs.json') as f:
         inputs = process_inputs(f.read())
     docs, desired, preferred, unavailable, prefer_double = inputs
-    solve_shift_scheduling(docs, desired, preferred, unavailable, prefer_double, MAX_UNFILLED, 30)
+    solve_shift_scheduling(
+        docs, desired, preferred, unavailable, prefer_double, MAX_UNFILLED, 30, name_vars=True,
+        verbose=True,
+    )
 
 
 if __name__ == "__main__":
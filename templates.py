@@ -0,0 +1,203 @@
+"""Cache of built models, keyed on the shape of the request.
+
+For the same number of docs, prefer_double flags, horizon, MAX_UNFILLED
+and rules, build_model creates the same variables and constraints: only
+the docs' (min, max) bounds and the request terms of the objective
+differ. A ModelTemplate keeps such a model, built once with open bounds
+and no requests; each request clones it, sets the bounds of the total
+shifts variables and adds its own request terms to the objective, which
+skips most of the Python-side building.
+
+Templates are kept in memory and optionally in a directory, as the text
+format of the model proto with the indices needed to patch it.
+"""
+
+import hashlib
+import json
+
+from ortools.sat.python import cp_model
+
+import cache
+import solve
+from rules import NUM_SHIFTS, UNFILLED, DEFAULT_RULES
+
+
+def template_key(prefer_double, max_unfilled, num_days, rules=DEFAULT_RULES):
+    """Returns a stable hash of the shape of a request.
+
+    Args:
+      prefer_double: each doc's prefer_double flag in doc order, None for
+        docs without one.
+      max_unfilled, num_days, rules: as for solve.build_model.
+    """
+    shape = {
+        "prefer_double": list(prefer_double),
+        "max_unfilled": max_unfilled,
+        "num_days": num_days,
+        "rules": rules,
+    }
+    encoded = json.dumps(shape, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ModelTemplate:
+    """A model without bounds and requests, and where to patch them in.
+
+    Attributes:
+      model: the cp_model.CpModel; it is only ever cloned.
+      num_docs: the number of docs, UNFILLED excluded.
+      num_days: the horizon.
+      total_vars: the proto index of each doc's total shifts variable.
+      obj_bool, obj_int: the (indices, coeffs, labels) of the objective
+        terms shared by every request.
+    """
+
+    def __init__(self, model, num_docs, num_days, total_vars, obj_bool, obj_int):
+        self.model = model
+        self.num_docs = num_docs
+        self.num_days = num_days
+        self.total_vars = total_vars
+        self.obj_bool = obj_bool
+        self.obj_int = obj_int
+
+    @classmethod
+    def build(cls, prefer_double, max_unfilled, num_days, rules=None):
+        """Builds the template of a shape; see template_key."""
+        docs = ["doc %i" % e for e in range(len(prefer_double))]
+        # Every doc may work every day until its bounds are patched in.
+        desired = {doc: (0, 2 * num_days) for doc in docs}
+        flags = {doc: flag for doc, flag in zip(docs, prefer_double) if flag is not None}
+        shift_model = solve.build_model(
+            docs, desired, {}, {}, flags, max_unfilled, num_days, rules=rules
+        )
+
+        def terms(variables, coeffs, labels):
+            return [var.Index() for var in variables], list(coeffs), list(labels)
+
+        return cls(
+            shift_model.model,
+            len(docs),
+            num_days,
+            [var.Index() for var in shift_model.total_vars[:-1]],
+            terms(shift_model.obj_bool_vars, shift_model.obj_bool_coeffs, shift_model.obj_bool_labels),
+            terms(shift_model.obj_int_vars, shift_model.obj_int_coeffs, shift_model.obj_int_labels),
+        )
+
+    def to_json(self):
+        return {
+            "proto": str(self.model.Proto()),
+            "num_docs": self.num_docs,
+            "num_days": self.num_days,
+            "total_vars": self.total_vars,
+            "obj_bool": self.obj_bool,
+            "obj_int": self.obj_int,
+        }
+
+    @classmethod
+    def from_json(cls, entry):
+        model = cp_model.CpModel()
+        model.Proto().parse_text_format(entry["proto"])
+
+        def terms(indices, coeffs, labels):
+            return indices, coeffs, [tuple(label) for label in labels]
+
+        return cls(
+            model, entry["num_docs"], entry["num_days"], entry["total_vars"],
+            terms(*entry["obj_bool"]), terms(*entry["obj_int"]),
+        )
+
+    def instantiate(
+        self, docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts, hint=None
+    ):
+        """Returns a solve.ShiftModel for a request of this shape.
+
+        The arguments are as for solve.build_model; the model is the same as
+        build_model would make, up to the order of the objective terms.
+        """
+        model = self.model.Clone()
+        proto = model.Proto()
+        num_days = self.num_days
+        docs = list(docs) + [UNFILLED]
+
+        # The indices come from the template, so the checks of
+        # CpModel.GetBoolVarFromProtoIndex would only slow this down.
+        def var(index):
+            return cp_model.IntVar(proto, index)
+
+        work = [
+            [[var((e * NUM_SHIFTS + s) * num_days + d) for d in range(num_days)]
+             for s in range(NUM_SHIFTS)]
+            for e in range(len(docs))
+        ]
+        shift_model = solve.ShiftModel(model, docs, num_days, work)
+
+        for e, index in enumerate(self.total_vars):
+            domain = proto.variables[index].domain
+            domain.clear()
+            domain.extend(desired_total_shifts[docs[e]])
+
+        indices, coeffs, labels = self.obj_bool
+        shift_model.obj_bool_vars.extend(var(i) for i in indices)
+        shift_model.obj_bool_coeffs.extend(coeffs)
+        shift_model.obj_bool_labels.extend(labels)
+        indices, coeffs, labels = self.obj_int
+        shift_model.obj_int_vars.extend(var(i) for i in indices)
+        shift_model.obj_int_coeffs.extend(coeffs)
+        shift_model.obj_int_labels.extend(labels)
+
+        doc_index = {doc: e for e, doc in enumerate(docs)}
+        requests = solve.request_terms(doc_index, preferences, unavailable)
+        for e, s, d, w in requests:
+            if d >= num_days:
+                continue
+            shift_model.obj_bool_vars.append(work[e][s][d])
+            shift_model.obj_bool_coeffs.append(w)
+            shift_model.obj_bool_labels.append(("request", e, s, d))
+
+        requested = {e for e, s, d, w in requests if d < num_days}
+        shift_model.symmetry_classes = solve.symmetry_classes(
+            docs[:-1], desired_total_shifts, requested, prefer_double_shifts
+        )
+        if hint:
+            shift_model.set_hint(hint)
+        shift_model.minimize()
+        return shift_model
+
+
+class TemplateCache:
+    """LRU cache of ModelTemplates, optionally backed by a directory."""
+
+    def __init__(self, capacity=32, directory=None):
+        self.__store = cache.LruStore(capacity, directory)
+
+    def get(self, prefer_double, max_unfilled, num_days, rules=None):
+        """Returns the ModelTemplate of a shape, building it on a miss."""
+        if rules is None:
+            rules = DEFAULT_RULES
+        key = template_key(prefer_double, max_unfilled, num_days, rules)
+        template = self.__store.get(key, ModelTemplate.from_json)
+        if template is None:
+            template = ModelTemplate.build(prefer_double, max_unfilled, num_days, rules)
+            self.__store.put(key, template, template.to_json())
+        return template
+
+    def build_model(
+        self,
+        docs,
+        desired_total_shifts,
+        preferences,
+        unavailable,
+        prefer_double_shifts,
+        max_unfilled,
+        num_days,
+        hint=None,
+        rules=None,
+    ):
+        """Returns the solve.ShiftModel of a request, as solve.build_model
+        would without names or symmetry breaking, from its shape's template.
+        """
+        prefer_double = [prefer_double_shifts.get(doc) for doc in docs]
+        template = self.get(prefer_double, max_unfilled, num_days, rules)
+        return template.instantiate(
+            docs, desired_total_shifts, preferences, unavailable, prefer_double_shifts, hint
+        )
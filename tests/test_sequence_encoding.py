@@ -0,0 +1,59 @@
+"""The counter encoding of sequence rules penalizes exactly like the
+clause encoding, on every assignment of a short horizon.
+"""
+
+import itertools
+import os
+import sys
+import unittest
+
+from ortools.sat.python import cp_model
+
+# The modules under test live at the top of the repository.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import solve
+
+NUM_DAYS = 9
+
+# (hard_min, soft_min, min_cost, soft_max, hard_max, max_cost)
+RULES = (
+    (1, 2, 20, 3, 4, 5),
+    (1, 1, 0, 2, 3, 7),
+    (2, 3, 4, 4, 6, 3),
+    (1, 3, 2, 8, 8, 0),
+)
+
+
+def least_penalty(add_sequence, rule, assignment):
+    """Returns the least penalty of `rule` on a fixed assignment, or None
+    if the rule forbids it.
+    """
+    model = cp_model.CpModel()
+    works = [model.NewBoolVar("") for value in assignment]
+    for var, value in zip(works, assignment):
+        model.Add(var == value)
+    variables, coeffs = add_sequence(model, works, *rule, None)
+    model.Minimize(cp_model.LinearExpr.WeightedSum(variables, coeffs))
+    solver = cp_model.CpSolver()
+    solver.parameters.num_workers = 1
+    status = solver.Solve(model)
+    if status == cp_model.INFEASIBLE:
+        return None
+    assert status == cp_model.OPTIMAL
+    return solver.ObjectiveValue()
+
+
+class SequenceEncodingTest(unittest.TestCase):
+
+    def test_counter_matches_clauses(self):
+        for rule in RULES:
+            for assignment in itertools.product((0, 1), repeat=NUM_DAYS):
+                with self.subTest(rule=rule, assignment=assignment):
+                    self.assertEqual(
+                        least_penalty(solve.add_soft_sequence_counter_constraint, rule, assignment),
+                        least_penalty(solve.add_soft_sequence_constraint, rule, assignment),
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
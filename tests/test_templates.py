@@ -0,0 +1,61 @@
+"""Models patched from a template are the models build_model makes."""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# The modules under test live at the top of the repository.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import bench
+import lns
+import solve
+import templates
+
+NUM_DOCS = 6
+NUM_DAYS = 14
+SEEDS = (1, 2, 3)
+
+POLICY = solve.StopPolicy(max_time=60.0)
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_instantiate_matches_build_model(self):
+        for seed in SEEDS:
+            with self.subTest(seed=seed):
+                inputs = solve.process_docs(bench.generate_roster(NUM_DOCS, NUM_DAYS, seed=seed))
+                fresh = solve.build_model(*inputs, solve.MAX_UNFILLED, NUM_DAYS)
+                with tempfile.TemporaryDirectory() as directory:
+                    # The first cache builds and stores the template, the
+                    # second reads it back from disk.
+                    templates.TemplateCache(directory=directory).get(
+                        [inputs[4][doc] for doc in inputs[0]], solve.MAX_UNFILLED, NUM_DAYS
+                    )
+                    patched = templates.TemplateCache(directory=directory).build_model(
+                        *inputs, solve.MAX_UNFILLED, NUM_DAYS
+                    )
+
+                fresh_proto, patched_proto = fresh.model.Proto(), patched.model.Proto()
+                self.assertEqual(len(patched_proto.variables), len(fresh_proto.variables))
+                self.assertEqual(len(patched_proto.constraints), len(fresh_proto.constraints))
+                self.assertEqual(
+                    sorted(patched.obj_bool_labels + patched.obj_int_labels),
+                    sorted(fresh.obj_bool_labels + fresh.obj_int_labels),
+                )
+
+                expected = solve.solve_model(fresh, POLICY, num_workers=1)
+                self.assertEqual(expected.status, "OPTIMAL")
+                actual = solve.solve_model(patched, POLICY, num_workers=1)
+                self.assertEqual(actual.status, "OPTIMAL")
+                self.assertEqual(actual.stats["objective"], expected.stats["objective"])
+
+                # The same assignment costs the same in both models.
+                fixed = solve.solve_model(
+                    lns.fix_outside(patched, expected, (), ()), POLICY, num_workers=1
+                )
+                self.assertEqual(fixed.stats["objective"], expected.stats["objective"])
+
+
+if __name__ == "__main__":
+    unittest.main()